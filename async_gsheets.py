@@ -0,0 +1,46 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SHEETS_WORKERS, SHEETS_MAX_CONCURRENCY
+
+
+class AsyncGoogleSheets:
+    """Асинхронная обертка над GoogleSheets: вызовы выполняются в пуле потоков"""
+    def __init__(self, gsheets, workers=SHEETS_WORKERS, max_concurrency=SHEETS_MAX_CONCURRENCY):
+        self.gsheets = gsheets
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gsheets')
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнить синхронную функцию в пуле, не блокируя цикл событий"""
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            # Переносим контекст (contextvars) вызывающей корутины в поток
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(
+                self.executor,
+                functools.partial(ctx.run, func, *args, **kwargs)
+            )
+
+    def bind(self, gsheets):
+        """Обертка над другим хранилищем с общим пулом потоков и лимитом"""
+        other = object.__new__(AsyncGoogleSheets)
+        other.gsheets = gsheets
+        other.executor = self.executor
+        other.semaphore = self.semaphore
+        return other
+
+    def __getattr__(self, name):
+        attr = getattr(self.gsheets, name)
+        if not callable(attr):
+            return attr
+        
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        return call
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
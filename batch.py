@@ -0,0 +1,57 @@
+from gspread.utils import rowcol_to_a1
+
+from config import BATCH_MAX_RANGES
+
+
+class BatchWriter:
+    """Накопитель изменений ячеек, записываемых одним batch_update"""
+    def __init__(self, cache, name, max_ranges=BATCH_MAX_RANGES):
+        self.cache = cache
+        self.name = name
+        self.max_ranges = max_ranges
+        self.cells = {}
+
+    def set(self, row, col, value):
+        """Запланировать запись ячейки (номера с 1)"""
+        self.cells[(row, col)] = value
+
+    def __len__(self):
+        return len(self.cells)
+
+    def _ranges(self):
+        """Склеить соседние ячейки одной колонки в диапазоны"""
+        ranges = []
+        for col in sorted({col for _, col in self.cells}):
+            rows = sorted(row for row, c in self.cells if c == col)
+            start = prev = rows[0]
+            for row in rows[1:] + [None]:
+                if row is not None and row == prev + 1:
+                    prev = row
+                    continue
+                ranges.append({
+                    'range': f"{rowcol_to_a1(start, col)}:{rowcol_to_a1(prev, col)}",
+                    'values': [[self.cells[(r, col)]] for r in range(start, prev + 1)]
+                })
+                if row is not None:
+                    start = prev = row
+        return ranges
+
+    def flush(self):
+        """Записать накопленные изменения и вернуть число запросов"""
+        if not self.cells:
+            return 0
+        
+        ranges = self._ranges()
+        requests = 0
+        for i in range(0, len(ranges), self.max_ranges):
+            self.cache.batch_update(self.name, ranges[i:i + self.max_ranges])
+            requests += 1
+        self.cells.clear()
+        return requests
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+
+from gspread.exceptions import APIError
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol
+from telegram.error import RetryAfter
+
+from config import SHEET_NAMES, DATES
+
+
+class FakeResponse:
+    """Ответ API для исключения APIError"""
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': self.text, 'status': 'RESOURCE_EXHAUSTED'}}
+
+
+class FakeBackend:
+    """Общие для всей имитации таблицы задержка, квота и счетчики запросов"""
+    def __init__(self, latency=0.0, quota_per_minute=0):
+        self.latency = latency
+        self.quota_per_minute = quota_per_minute
+        self.calls = Counter()
+        self.window = deque()
+        self.lock = threading.Lock()
+
+    def request(self, method):
+        """Учесть один запрос к API: квота, счетчик и задержка сети"""
+        with self.lock:
+            now = time.monotonic()
+            if self.quota_per_minute:
+                while self.window and now - self.window[0] >= 60:
+                    self.window.popleft()
+                if len(self.window) >= self.quota_per_minute:
+                    self.calls['429'] += 1
+                    raise APIError(FakeResponse(429, 'Quota exceeded'))
+                self.window.append(now)
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def total(self):
+        with self.lock:
+            return sum(count for method, count in self.calls.items() if method != '429')
+
+
+class FakeWorksheet:
+    """Лист таблицы в памяти с интерфейсом gspread.Worksheet"""
+    def __init__(self, spreadsheet, title, values):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.data = [[str(v) for v in row] for row in values]
+        self.lock = threading.Lock()
+
+    def _set(self, row, col, value):
+        while len(self.data) < row:
+            self.data.append([])
+        cells = self.data[row - 1]
+        while len(cells) < col:
+            cells.append('')
+        cells[col - 1] = str(value)
+
+    def _write(self, a1_range, values):
+        if '!' in a1_range:
+            a1_range = a1_range.split('!')[1]
+        row, col = a1_to_rowcol(a1_range.split(':')[0])
+        with self.lock:
+            for i, row_values in enumerate(values):
+                for j, value in enumerate(row_values):
+                    self._set(row + i, col + j, value)
+
+    def get_all_values(self, *args, **kwargs):
+        self.spreadsheet.backend.request('get_all_values')
+        with self.lock:
+            return [list(row) for row in self.data]
+
+    def get(self, a1_range, **kwargs):
+        self.spreadsheet.backend.request('get')
+        grid = a1_range_to_grid_range(a1_range)
+        with self.lock:
+            result = []
+            for r in range(grid.get('startRowIndex', 0), min(grid.get('endRowIndex', len(self.data)), len(self.data))):
+                row = self.data[r]
+                result.append(row[grid.get('startColumnIndex', 0):grid.get('endColumnIndex', len(row))])
+            return result
+
+    def update_cell(self, row, col, value):
+        self.spreadsheet.backend.request('update_cell')
+        with self.lock:
+            self._set(row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        self.spreadsheet.backend.request('batch_update')
+        for item in data:
+            self._write(item['range'], item['values'])
+
+    def append_row(self, values, **kwargs):
+        self.spreadsheet.backend.request('append_row')
+        with self.lock:
+            self.data.append([str(v) for v in values])
+
+    def append_rows(self, rows, **kwargs):
+        self.spreadsheet.backend.request('append_rows')
+        with self.lock:
+            self.data.extend([str(v) for v in values] for values in rows)
+
+
+class FakeSpreadsheet:
+    """Таблица в памяти с интерфейсом gspread.Spreadsheet"""
+    def __init__(self, backend, sheets):
+        self.backend = backend
+        self.id = 'bench'
+        self.sheets = {title: FakeWorksheet(self, title, values) for title, values in sheets.items()}
+
+    def worksheets(self, *args):
+        self.backend.request('worksheets')
+        return list(self.sheets.values())
+
+    def worksheet(self, title):
+        self.backend.request('worksheet')
+        return self.sheets[title]
+
+    def values_batch_update(self, params=None, body=None):
+        self.backend.request('values_batch_update')
+        for item in body['data']:
+            title, a1_range = item['range'].split('!')
+            self.sheets[title.strip("'")]._write(a1_range, item['values'])
+
+
+class FakeClient:
+    """Клиент gspread, который открывает таблицу в памяти"""
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        self.spreadsheet.backend.request('open_by_key')
+        return self.spreadsheet
+
+
+def participant_name(i):
+    return f"Участник_{i} Бенч Бенчевич"
+
+
+def make_spreadsheet(users, tasks=50, backend=None):
+    """Таблица с users зарегистрированными участниками и tasks заданиями"""
+    backend = backend or FakeBackend()
+    columns = [date.replace('.', '_') for date in DATES]
+    sheets = {
+        SHEET_NAMES['users']: [['ID_Telegram', 'ФИО', 'Статус', 'Дата_регистрации']],
+        SHEET_NAMES['tasks']: [['ID_Задания', 'Текст_задания']] + [
+            [i, f"Задание номер {i}"] for i in range(1, tasks + 1)
+        ],
+        SHEET_NAMES['schedules']: [['ID_Участника', 'ФИО'] + [f"Дата_{c}" for c in columns]],
+        SHEET_NAMES['progress']: [
+            ['ID_Участника', 'ФИО', 'День'] + [f"Статус_{c}" for c in columns] + ['Всего_выполнено']
+        ],
+        SHEET_NAMES['config']: [
+            ['Следующая_дата', 'Текущий_индекс', 'Дата_последней_рассылки'],
+            [DATES[0], 0, '']
+        ]
+    }
+    for i in range(users):
+        user_id = 100000 + i
+        name = participant_name(i)
+        sheets[SHEET_NAMES['users']].append([user_id, name, 'активен', '01.12.2025'])
+        sheets[SHEET_NAMES['schedules']].append(
+            [user_id, name] + [(i + day) % tasks + 1 for day in range(len(DATES))]
+        )
+        sheets[SHEET_NAMES['progress']].append([user_id, name, 0] + ['➖'] * len(DATES) + [0])
+    return FakeSpreadsheet(backend, sheets)
+
+
+class FakeBot:
+    """Имитация telegram.Bot: задержка отправки и ограничение частоты"""
+    def __init__(self, latency=0.0, flood_rate=0, **kwargs):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.sent = 0
+        self.flood_errors = 0
+        self.window = deque()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.flood_rate:
+            now = time.monotonic()
+            while self.window and now - self.window[0] >= 1:
+                self.window.popleft()
+            if len(self.window) >= self.flood_rate:
+                self.flood_errors += 1
+                raise RetryAfter(1)
+            self.window.append(now)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.first_name = 'Бенч'
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+class FakeUpdate:
+    """Минимальный Update для вызова обработчиков бота"""
+    def __init__(self, user_id, text=''):
+        self.effective_user = FakeUser(user_id)
+        self.message = FakeMessage(text)
@@ -0,0 +1,176 @@
+"""Бенчмарк основных операций бота на имитации Google Таблицы и Telegram.
+
+Запуск:
+    python -m bench.run --users 100 1000 10000
+    python -m bench.run --users 1000 --latency 0.05 --quota 300 --backend sqlite
+"""
+import argparse
+import asyncio
+import functools
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import config
+from bench.fakes import (
+    FakeBackend, FakeBot, FakeClient, FakeUpdate, make_spreadsheet, participant_name
+)
+from config import COALESCE_WINDOWS, DATES, SHEETS_QUOTA_BURST
+
+
+class FrozenDatetime(datetime):
+    """Часы бота в день первой рассылки"""
+    @classmethod
+    def now(cls, tz=None):
+        moment = datetime.strptime(DATES[0], '%d.%m.%Y') - timedelta(days=1)
+        moment = moment.replace(hour=18)
+        return tz.localize(moment) if tz else moment
+
+
+class Result:
+    def __init__(self, name, users, ops, seconds, api_calls):
+        self.name = name
+        self.users = users
+        self.ops = ops
+        self.seconds = seconds
+        self.api_calls = api_calls
+
+    def row(self):
+        per_op = self.seconds / self.ops * 1000 if self.ops else 0.0
+        calls_per_op = self.api_calls / self.ops if self.ops else 0.0
+        return (
+            f"{self.name:<18}{self.users:>8}{self.ops:>7}{self.seconds:>10.3f}"
+            f"{per_op:>11.2f}{self.api_calls:>8}{calls_per_op:>9.2f}"
+        )
+
+
+HEADER = f"{'операция':<18}{'N':>8}{'опер.':>7}{'время, с':>10}{'мс/опер.':>11}{'API':>8}{'API/оп.':>9}"
+
+
+def build_storage(args, users):
+    """Хранилище поверх имитации таблицы с N участниками"""
+    from gsheets import GoogleSheets
+    from quota import RequestScheduler
+
+    backend = FakeBackend(latency=args.latency, quota_per_minute=args.quota)
+    spreadsheet = make_spreadsheet(users, backend=backend)
+    if args.quota:
+        scheduler = RequestScheduler(per_minute=args.quota, burst=SHEETS_QUOTA_BURST)
+    else:
+        scheduler = RequestScheduler(per_minute=10 ** 9, burst=10 ** 6)
+    sheets = GoogleSheets(client=FakeClient(spreadsheet), requests=scheduler)
+    if args.backend == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        path = os.path.join(tempfile.mkdtemp(prefix='advent-bench-'), 'bench.sqlite3')
+        sheets = SQLiteStorage(path, sheets)
+    return sheets, backend
+
+
+async def measure(name, users, backend, calls):
+    """Выполнить корутины по очереди и замерить время и число запросов к API"""
+    api_before = backend.total()
+    started = time.perf_counter()
+    for call in calls:
+        await call()
+    seconds = time.perf_counter() - started
+    return Result(name, users, len(calls), seconds, backend.total() - api_before)
+
+
+async def run_scenario(bot, args, users):
+    from async_gsheets import AsyncGoogleSheets
+    from coalesce import Coalescer
+    from render_cache import RenderCache
+    from storage import LazyStorage
+
+    from journal import BroadcastJournal
+
+    sheets, backend = build_storage(args, users)
+    bot.pool = AsyncGoogleSheets(None)
+    calendar = bot.Calendar(sheets.campaign, LazyStorage(lambda: sheets))
+    bot.calendars = [calendar]
+    calendar.sheets.start_warmup()
+    await calendar.sheets.wait_ready()
+    bot.schedule_cache = RenderCache()
+    bot.coalescer = Coalescer(COALESCE_WINDOWS)
+    bot.journal = BroadcastJournal(os.path.join(tempfile.mkdtemp(prefix='advent-bench-'), 'journal.sqlite3'))
+
+    sample = min(args.sample, users)
+    ids = [100000 + i * max(1, users // max(1, sample)) for i in range(sample)]
+    results = []
+
+    # Регистрация: половина - новые участники, половина - уже в списке (повторный /start)
+    registrations = [
+        functools.partial(bot.handle_name, FakeUpdate(900000 + i, f"Новый_{i} Бенч Бенчевич"), None)
+        for i in range(sample // 2)
+    ] + [
+        functools.partial(bot.handle_name, FakeUpdate(user_id, participant_name(user_id - 100000)), None)
+        for user_id in ids[:sample - sample // 2]
+    ]
+    results.append(await measure('register_user', users, backend, registrations))
+
+    results.append(await measure('send_daily_tasks', users, backend, [bot.send_daily_tasks]))
+
+    results.append(await measure('show_schedule', users, backend, [
+        functools.partial(bot.show_schedule, FakeUpdate(user_id), None) for user_id in ids
+    ]))
+    # Повторный просмотр - из кэша готовых ответов
+    results.append(await measure('show_schedule x2', users, backend, [
+        functools.partial(bot.show_schedule, FakeUpdate(user_id), None) for user_id in ids
+    ]))
+
+    results.append(await measure('mark_task_done', users, backend, [
+        functools.partial(bot.mark_done, FakeUpdate(user_id), None) for user_id in ids
+    ]))
+
+    results.append(await measure(
+        'check_deadlines', users, backend, [functools.partial(bot.check_deadlines, dry_run=False)]
+    ))
+
+    if args.backend == 'sqlite':
+        # Отложенная запись всех накопленных изменений в таблицу
+        results.append(await measure('sync_storage', users, backend, [bot.sync_storage]))
+
+    bot.pool.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк бота на имитации Google Таблицы и Telegram")
+    parser.add_argument('--users', type=int, nargs='+', default=[100, 1000, 10000],
+                        help="Число участников в таблице")
+    parser.add_argument('--sample', type=int, default=50,
+                        help="Сколько раз выполнять пользовательские команды")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Задержка одного запроса к Sheets API, секунды")
+    parser.add_argument('--quota', type=int, default=0,
+                        help="Квота Sheets API в минуту (0 - без ограничения)")
+    parser.add_argument('--telegram-latency', type=float, default=0.0,
+                        help="Задержка отправки одного сообщения, секунды")
+    parser.add_argument('--broadcast-rate', type=int, default=1000,
+                        help="Сообщений в секунду при рассылке")
+    parser.add_argument('--backend', choices=('sheets', 'sqlite'), default='sheets')
+    args = parser.parse_args()
+
+    # Журнал рассылок бот открывает при импорте - держим его в памяти
+    config.BROADCAST_JOURNAL_PATH = ':memory:'
+    import bot
+    from broadcast import Broadcaster
+    from campaigns import Campaign
+
+    logging.getLogger().setLevel(logging.WARNING)
+    bot.datetime = FrozenDatetime
+    bot.Bot = lambda token=None: FakeBot(latency=args.telegram_latency)
+    bot.Broadcaster = functools.partial(Broadcaster, rate=args.broadcast_rate, chat_interval=0)
+    # Замеры не должны зависеть от того, запущены ли они до дедлайна
+    Campaign.before_deadline = lambda self, now=None: True
+
+    print(HEADER)
+    for users in args.users:
+        for result in asyncio.run(run_scenario(bot, args, users)):
+            print(result.row())
+
+
+if __name__ == '__main__':
+    main()
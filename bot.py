@@ -1,15 +1,26 @@
 import asyncio
+import functools
 import logging
 from datetime import datetime
-from telegram import Update
+from telegram import Bot, Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram.constants import ParseMode
 import pytz
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
+from broadcast import Broadcaster
+from campaigns import load_campaigns, parse_time
+from coalesce import Coalescer
 from config import *
-from gsheets import GoogleSheets
+from async_gsheets import AsyncGoogleSheets
+from journal import BroadcastJournal
+from metrics import metrics, start_http_server, timed_handler, timed_job
+from quota import bulk_job
+from render_cache import RenderCache
+from storage import LazyStorage, StorageNotReady, create_storage
 
 # Настройка логирования
 logging.basicConfig(
@@ -18,18 +29,70 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация Google Sheets
-gsheets = GoogleSheets()
+# Общий пул потоков для запросов к таблицам всех календарей
+pool = AsyncGoogleSheets(None)
+
+
+class Calendar:
+    """Календарь (кампания) бота.
+    
+    sheets - синхронное хранилище для кода в пуле потоков,
+    gsheets - асинхронная обертка для обработчиков и задач планировщика.
+    Подключение к таблице идет в фоне после запуска бота (см. post_init)
+    """
+    def __init__(self, campaign, sheets=None):
+        self.campaign = campaign
+        self.sheets = sheets or LazyStorage(functools.partial(create_storage, campaign))
+        self.gsheets = pool.bind(self.sheets)
+
+    def run_key(self, date):
+        """Ключ рассылки в журнале доставки"""
+        return f"{self.campaign.key}:{date}"
+
+
+# Календари из CAMPAIGNS_FILE (или один календарь из config.py)
+calendars = [Calendar(campaign) for campaign in load_campaigns()]
+
+
+def get_calendar(key=None):
+    """Календарь по ключу кампании (по умолчанию - первый)"""
+    if key is None:
+        return calendars[0]
+    for calendar in calendars:
+        if calendar.campaign.key == key:
+            return calendar
+    return None
+
+
+async def user_calendar(user_id):
+    """Календарь, в котором зарегистрирован пользователь"""
+    if len(calendars) == 1:
+        return calendars[0]
+    for calendar in calendars:
+        if await calendar.gsheets.has_user(user_id):
+            return calendar
+    return None
+
+# Готовые ответы /расписание по пользователям
+schedule_cache = RenderCache()
+
+# Повторные /выполнено и /расписание одного пользователя выполняются один раз
+coalescer = Coalescer(COALESCE_WINDOWS)
+
+# Кому рассылка уже доставлена - чтобы после сбоя продолжить, а не начать заново
+journal = BroadcastJournal(BROADCAST_JOURNAL_PATH)
 
 # Команда /start
+@timed_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
+    campaign = calendars[0].campaign
     await update.message.reply_text(
         f"🎄 Привет, {user.first_name}!\n\n"
         "Я — бот для новогоднего Advent Calendar!\n\n"
         "📋 Для регистрации отправь мне своё **ФИО** (как в списке участников).\n\n"
-        "После регистрации ты будешь получать ежедневные задания на 7 дней.\n"
-        "Каждое задание нужно выполнить до 20:00 следующего дня.\n\n"
+        f"После регистрации ты будешь получать ежедневные задания на {campaign.days} дней.\n"
+        f"Каждое задание нужно выполнить до {campaign.deadline_time} следующего дня.\n\n"
         "📌 Доступные команды:\n"
         "/start - начать регистрацию\n"
         "/расписание - показать твои задания\n"
@@ -39,6 +102,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # Обработка ФИО для регистрации
+@timed_handler
 async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     full_name = update.message.text.strip()
     user_id = update.effective_user.id
@@ -47,30 +111,25 @@ async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Пожалуйста, введите ФИО полностью (например, Иванов Иван Иванович)")
         return
     
-    # Регистрируем пользователя
-    result = gsheets.register_user(user_id, full_name)
+    # Регистрируем пользователя в календаре, где он уже есть или где его ждут по ФИО
+    calendar = await user_calendar(user_id)
+    if calendar is None:
+        calendar = calendars[0]
+        for candidate in calendars:
+            if await candidate.gsheets.has_participant(full_name):
+                calendar = candidate
+                break
+    result = await calendar.gsheets.register_user(user_id, full_name)
+    coalescer.invalidate(user_id)
     await update.message.reply_text(result)
 
-# Команда /расписание
-async def show_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
+# Формирование сообщения /расписание
+def render_schedule(calendar, progress, schedule, current_idx):
+    """Собрать текст расписания пользователя"""
+    campaign = calendar.campaign
+    message = f"📅 **Ваш {campaign.title}**\n\n"
     
-    # Получаем прогресс и расписание
-    progress = gsheets.get_user_progress(user_id)
-    schedule = gsheets.get_user_schedule(user_id)
-    
-    if not progress or not schedule:
-        await update.message.reply_text("Вы не зарегистрированы. Используйте /start")
-        return
-    
-    # Получаем конфигурацию
-    config = gsheets.get_config()
-    current_idx = config.get('Текущий_индекс', 0) if config else 0
-    
-    # Формируем сообщение
-    message = "📅 **Ваш Advent Calendar 2025**\n\n"
-    
-    for i, date in enumerate(DATES):
+    for i, date in enumerate(campaign.dates):
         # Получаем ключ для колонки с датой
         date_key = f"Дата_{date.replace('.', '_')}"
         task_id = schedule.get(date_key) if schedule else None
@@ -78,7 +137,6 @@ async def show_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
         status = progress.get(status_key, '➖') if progress else '➖'
         
         if i < current_idx:  # Прошедшие дни
-            task_text = gsheets.get_task_text(task_id) if task_id else "Задание не найдено"
             message += f"**{date} [День {i+1}]**: {status}\n"
             if status == '✅':
                 message += f"✅ Выполнено\n\n"
@@ -86,64 +144,219 @@ async def show_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 message += f"✖️ Просрочено\n\n"
         elif i == current_idx:  # Текущий день
             if task_id and status == '⏳':
-                task_text = gsheets.get_task_text(task_id)
+                task_text = calendar.sheets.get_task_text(task_id)
                 message += f"**{date} [День {i+1}]**: ⏳ Активно\n"
                 message += f"📝 *Задание*: {task_text}\n"
-                message += f"⏰ *Срок*: до 20:00 сегодня\n\n"
+                message += f"⏰ *Срок*: до {campaign.deadline_time} сегодня\n\n"
             else:
                 message += f"**{date} [День {i+1}]**: ➖ Ожидается\n\n"
         else:  # Будущие дни
             message += f"**{date} [День {i+1}]**: ➖ Сюрприз!\n\n"
     
+    return message
+
+# Сообщение /расписание для пользователя (None - не зарегистрирован)
+async def build_schedule(calendar, user_id):
+    gsheets = calendar.gsheets
+    
+    # Получаем конфигурацию
+    config = await gsheets.get_config()
+    current_idx = config.get('Текущий_индекс', 0) if config else 0
+    
+    # Версию берем до чтения данных: если они изменятся, ключ просто устареет
+    cache_key = (calendar.campaign.key, current_idx, calendar.sheets.data_version(user_id))
+    message = schedule_cache.get(user_id, cache_key)
+    
+    if message is None:
+        # Получаем прогресс и расписание
+        progress = await gsheets.get_user_progress(user_id)
+        schedule = await gsheets.get_user_schedule(user_id)
+        
+        if not progress or not schedule:
+            return None
+        
+        message = render_schedule(calendar, progress, schedule, current_idx)
+        schedule_cache.put(user_id, cache_key, message)
+    
+    return message
+
+# Команда /расписание
+@timed_handler
+async def show_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    
+    calendar = await user_calendar(user_id)
+    message = None
+    if calendar is not None:
+        message = await coalescer.run('расписание', user_id, build_schedule, calendar, user_id)
+    if message is None:
+        await update.message.reply_text("Вы не зарегистрированы. Используйте /start")
+        return
+    
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
 # Команда /выполнено
+@timed_handler
 async def mark_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
-    result = gsheets.mark_task_done(user_id)
+    calendar = await user_calendar(user_id)
+    if calendar is None:
+        await update.message.reply_text("Пользователь не найден")
+        return
+    
+    result = await coalescer.run('выполнено', user_id, calendar.gsheets.mark_task_done, user_id)
+    # Расписание после отметки должно показать новый статус
+    coalescer.invalidate(user_id, 'расписание')
     await update.message.reply_text(result)
 
 # Команда /статистика
+@timed_handler
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    progress_ws = gsheets.get_worksheet('progress')
-    all_progress = progress_ws.get_all_records()
+    user_id = update.effective_user.id
+    calendar = await user_calendar(user_id) or calendars[0]
+    gsheets = calendar.gsheets
     
-    # Сортируем по выполненным заданиям
-    sorted_users = sorted(
-        [p for p in all_progress if p.get('Всего_выполнено', 0) > 0],
-        key=lambda x: x.get('Всего_выполнено', 0),
-        reverse=True
-    )[:5]  # Топ-5
+    # Топ-5 из рейтинга в памяти
+    top_users = await gsheets.get_leaderboard(5)
     
-    if not sorted_users:
+    if not top_users:
         await update.message.reply_text("📊 Пока никто не выполнил заданий. Будьте первыми!")
         return
     
     message = "🏆 **Топ участников**\n\n"
     
-    for i, user in enumerate(sorted_users):
+    for i, (name, done) in enumerate(top_users):
         emoji = ["🥇", "🥈", "🥉", "4️⃣", "5️⃣"][i] if i < 5 else "🏅"
-        message += f"{emoji} {user['ФИО']} - {user['Всего_выполнено']} заданий\n"
+        message += f"{emoji} {name} - {done} заданий\n"
+    
+    # Место самого участника
+    rank = await gsheets.get_user_rank(user_id)
+    if rank and rank[1] > 0 and rank[0] > len(top_users):
+        message += f"\n📍 Ваше место: {rank[0]} ({rank[1]} заданий)"
     
     # Текущий день
-    config = gsheets.get_config()
+    config = await gsheets.get_config()
     if config and config.get('Текущий_индекс', 0) > 0:
         current_day = config.get('Текущий_индекс', 0)
-        message += f"\n📆 *Текущий день: {current_day} из 7*"
+        message += f"\n📆 *Текущий день: {current_day} из {calendar.campaign.days}*"
     
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
+# Проверка прав организатора
+def is_admin(update: Update):
+    return update.effective_user.id in ADMIN_IDS
+
+# Команда /reload_tasks
+@timed_handler
+async def reload_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        return
+    
+    for calendar in calendars:
+        count = await calendar.gsheets.reload_tasks()
+        title = f" ({calendar.campaign.title})" if len(calendars) > 1 else ""
+        await update.message.reply_text(f"🔄 Каталог заданий обновлен{title}: {count} заданий")
+
+# Команда /cache_stats
+@timed_handler
+async def cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        return
+    
+    stats = schedule_cache.stats()
+    message = (
+        f"📦 Кэш /расписание: попаданий {stats['hits']}, промахов {stats['misses']}, "
+        f"доля попаданий {stats['hit_ratio']:.0%}, записей {stats['size']}"
+    )
+    
+    # Планировщик запросов общий для всех календарей
+    requests = calendars[0].sheets.request_stats()
+    if requests:
+        message += (
+            f"\n📡 Sheets API: запросов {requests['calls']}, ждали квоту {requests['throttled']}, "
+            f"429 {requests['rate_limited']}, повторов {requests['retried']}, ошибок {requests['failed']}"
+        )
+    
+    for calendar in calendars:
+        sheets = calendar.sheets.sheet_cache_stats()
+        if not sheets:
+            continue
+        title = f" ({calendar.campaign.title})" if len(calendars) > 1 else ""
+        message += f"\n🗂 Кэш листов{title}:"
+        for name, counters in sheets.items():
+            message += f"\n• {name}: попаданий {counters['hits']}, промахов {counters['misses']}"
+    
+    for command, counters in coalescer.stats().items():
+        message += (
+            f"\n🔁 /{command}: выполнено {counters['calls']}, "
+            f"сэкономлено {counters['joined'] + counters['reused']} "
+            f"(ждали общий ответ {counters['joined']}, повтор в окне {counters['reused']})"
+        )
+    await update.message.reply_text(message)
+
+# Команда /deadlines_dry_run
+@timed_handler
+async def deadlines_dry_run(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        return
+    
+    for calendar in calendars:
+        calendar.sheets.check_ready()
+        count = await check_deadlines(calendar.campaign.key, dry_run=True)
+        title = f" ({calendar.campaign.title})" if len(calendars) > 1 else ""
+        await update.message.reply_text(f"🔎 При проверке дедлайнов станут просроченными{title}: {count}")
+
+# Команда /metrics
+@timed_handler
+async def show_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        return
+    
+    message = "📈 Обработчики (вызовов, среднее, p95):\n"
+    for labels, (count, avg, p95) in metrics.summary('bot_handler_seconds').items():
+        message += f"• {dict(labels)['handler']}: {count}, {avg * 1000:.0f} мс, ≤{p95 * 1000:.0f} мс\n"
+    
+    requests = metrics.totals('sheets_requests_total', 'command')
+    if requests:
+        message += "\n📡 Запросы к Sheets API по командам:\n"
+        for command, count in sorted(requests.items(), key=lambda item: -item[1]):
+            message += f"• {command}: {count}\n"
+    
+    hits = metrics.totals('sheet_cache_hits_total', 'sheet')
+    misses = metrics.totals('sheet_cache_misses_total', 'sheet')
+    if hits or misses:
+        message += "\n🗂 Кэш листов (попаданий / промахов):\n"
+        for sheet in sorted(set(hits) | set(misses)):
+            message += f"• {sheet}: {hits.get(sheet, 0)} / {misses.get(sheet, 0)}\n"
+    
+    jobs = metrics.summary('bot_job_seconds')
+    if jobs:
+        message += "\n⏱ Задачи планировщика:\n"
+        for labels, (count, avg, p95) in jobs.items():
+            message += f"• {dict(labels)['job']}: {count}, в среднем {avg:.1f} с\n"
+    
+    sent = metrics.totals('broadcast_messages_total', 'result')
+    if sent:
+        rate = metrics.value('broadcast_last_rate')
+        message += (
+            f"\n📨 Рассылка: отправлено {sent.get('sent', 0)}, ошибок {sent.get('failed', 0)}, "
+            f"последняя скорость {rate} сообщ/с"
+        )
+    await update.message.reply_text(message)
+
 # Команда /help
+@timed_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    campaign = calendars[0].campaign
     await update.message.reply_text(
         "❓ **Помощь**\n\n"
         "📋 **Регистрация:**\n"
         "1. Нажмите /start\n"
         "2. Отправьте боту своё ФИО\n\n"
         "📅 **Ежедневно:**\n"
-        "• В 18:00 вы получите задание на завтра\n"
-        "• До 20:00 нужно выполнить задание\n"
+        f"• В {campaign.send_time} вы получите задание на завтра\n"
+        f"• До {campaign.deadline_time} нужно выполнить задание\n"
         "• Нажмите /выполнено для отметки\n\n"
         "📊 **Команды:**\n"
         "/расписание - ваши задания\n"
@@ -152,13 +365,77 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/help - эта справка"
     )
 
+# Ошибки обработчиков
+async def handle_error(update: object, context: ContextTypes.DEFAULT_TYPE):
+    if isinstance(context.error, StorageNotReady):
+        # Бот только что запущен и еще подключается к таблице
+        if isinstance(update, Update) and update.message:
+            await update.message.reply_text("⏳ Бот запускается, повторите команду через минуту.")
+        return
+    logger.error("Ошибка при обработке обновления", exc_info=context.error)
+
+# Подключение к хранилищу после запуска Application
+async def post_init(application: Application):
+    for calendar in calendars:
+        calendar.sheets.start_warmup()
+
+# Подготовка рассылки
+def prepare_broadcast(calendar, next_date, date_index, run_key):
+    """Сформировать сообщения для еще не получивших задание: (сообщения, всего участников)"""
+    sheets = calendar.sheets
+    
+    # Загружаем пользователей и расписания одним чтением на лист
+    users = sheets.get_all_active_users()
+    schedules = sheets.get_all_schedules()
+    date_key = f"Дата_{next_date.replace('.', '_')}"
+    
+    messages = []
+    for user in users:
+        # Получаем задание пользователя
+        schedule = schedules.get(str(user['id']))
+        task_id = schedule.get(date_key) if schedule else None
+        if not task_id:
+            continue
+        
+        task_text = sheets.get_task_text(task_id)
+        
+        # Формируем сообщение
+        message = (
+            f"🎄 **Задание на завтра, {next_date}!**\n\n"
+            f"📝 {task_text}\n\n"
+            f"⏰ *Срок выполнения:* до {calendar.campaign.deadline_time} завтра\n"
+            f"✅ Чтобы отметить выполнение, нажмите /выполнено\n\n"
+            f"Удачи! 🎅"
+        )
+        messages.append((user['id'], message))
+    
+    # Отправляем только тем, кому сообщение еще не доставлено
+    total = len(messages)
+    pending = journal.start(run_key, [chat_id for chat_id, _ in messages])
+    messages = [(chat_id, text) for chat_id, text in messages if chat_id in pending]
+    
+    # Обновляем статусы заданий одним запросом. Только поверх «➖»: при продолжении
+    # рассылки нельзя вернуть в «⏳» уже выполненное задание
+    sheets.update_task_statuses([chat_id for chat_id, _ in messages], date_index, '⏳', only_if='➖')
+    return messages, total
+
 # Рассылка заданий
-async def send_daily_tasks():
-    """Рассылка заданий в 18:00"""
-    logger.info("Запуск рассылки заданий...")
+@timed_job
+@bulk_job
+async def send_daily_tasks(campaign_key=None):
+    """Рассылка заданий накануне дня задания"""
+    calendar = get_calendar(campaign_key)
+    if calendar is None:
+        logger.error(f"Кампания {campaign_key} не найдена")
+        return
+    campaign = calendar.campaign
+    gsheets = calendar.gsheets
+    
+    logger.info(f"Запуск рассылки заданий ({campaign.key})...")
+    await calendar.sheets.wait_ready()
     
     # Получаем конфигурацию
-    config = gsheets.get_config()
+    config = await gsheets.get_config()
     if not config:
         logger.error("Конфигурация не найдена")
         return
@@ -167,115 +444,149 @@ async def send_daily_tasks():
     current_idx = config.get('Текущий_индекс', 0)
     
     # Проверяем, нужно ли сегодня рассылать
-    tz = pytz.timezone(TIMEZONE)
+    tz = pytz.timezone(campaign.timezone)
     today = datetime.now(tz).strftime('%d.%m.%Y')
     
-    # Находим индекс даты в DATES
+    # Находим индекс даты в календаре
     try:
-        date_index = DATES.index(next_date)
+        date_index = campaign.dates.index(next_date)
     except ValueError:
-        logger.error(f"Дата {next_date} не найдена в списке DATES")
+        logger.error(f"Дата {next_date} не найдена в датах кампании {campaign.key}")
         return
     
     # Определяем дату рассылки (день перед заданием)
-    if date_index > 0:
-        send_date = DATES[date_index - 1]
-    else:
-        # Для первого дня рассылаем 16.12
-        send_date = "16.12.2025"
+    send_date = campaign.send_date(date_index)
     
-    if today != send_date:
+    # Прерванную рассылку продолжаем в любой день
+    run_key = calendar.run_key(next_date)
+    resume = journal.is_unfinished(run_key)
+    if today != send_date and not resume:
         logger.info(f"Сегодня {today}, а рассылка для {send_date}. Пропускаем.")
         return
     
-    # Получаем всех активных пользователей
-    users = gsheets.get_all_active_users()
-    
-    # Создаем временный объект Application для рассылки
-    from telegram import Bot
-    bot = Bot(token=TELEGRAM_TOKEN)
+    # Готовим все сообщения заранее и отмечаем задания активными
+    messages, total = await gsheets.run(prepare_broadcast, calendar, next_date, date_index, run_key)
+    if resume:
+        logger.info(f"Продолжаем рассылку для {next_date}: осталось {len(messages)} из {total}")
     
-    for user in users:
-        try:
-            # Получаем задание пользователя
-            schedule = gsheets.get_user_schedule(user['id'])
-            if not schedule:
-                continue
-            
-            # Получаем ключ для даты
-            date_key = f"Дата_{next_date.replace('.', '_')}"
-            task_id = schedule.get(date_key)
-            if not task_id:
-                continue
-            
-            task_text = gsheets.get_task_text(task_id)
-            
-            # Формируем сообщение
-            message = (
-                f"🎄 **Задание на завтра, {next_date}!**\n\n"
-                f"📝 {task_text}\n\n"
-                f"⏰ *Срок выполнения:* до 20:00 завтра\n"
-                f"✅ Чтобы отметить выполнение, нажмите /выполнено\n\n"
-                f"Удачи! 🎅"
-            )
-            
-            # Обновляем статус задания
-            gsheets.update_task_status(user['id'], date_index, '⏳')
-            
-            # Отправляем сообщение
-            await bot.send_message(
-                chat_id=user['id'],
-                text=message,
-                parse_mode=ParseMode.MARKDOWN
-            )
-            
-            logger.info(f"Отправлено задание пользователю {user['name']}")
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки пользователю {user['name']}: {e}")
+    # Рассылаем параллельно с учетом лимитов Telegram
+    async with Bot(token=TELEGRAM_TOKEN) as bot:
+        stats = await Broadcaster(bot).run(
+            messages,
+            on_sent=lambda chat_id: journal.mark_sent(run_key, chat_id)
+        )
+    journal.finish(run_key)
+    logger.info(f"Рассылка: {stats.summary()}")
     
     # Обновляем следующую дату
-    gsheets.update_next_date()
+    await advance_date(calendar, next_date)
     logger.info(f"Рассылка для {next_date} завершена. Следующая дата обновлена.")
 
+# Переход к следующей дате после рассылки
+async def advance_date(calendar, date):
+    """Обновить следующую дату после рассылки date, если это еще не сделано"""
+    config = await calendar.gsheets.get_config()
+    # После рассылки дня с индексом i текущий индекс становится i + 1
+    if config and config.get('Текущий_индекс', 0) == calendar.campaign.dates.index(date):
+        await calendar.gsheets.update_next_date()
+    journal.advance(calendar.run_key(date))
+
 # Проверка дедлайнов
-async def check_deadlines():
-    """Проверка дедлайнов в 20:01"""
-    logger.info("Проверка дедлайнов...")
+@timed_job
+@bulk_job
+async def check_deadlines(campaign_key=None, dry_run=DEADLINE_DRY_RUN):
+    """Проверка дедлайнов сразу после срока сдачи"""
+    calendar = get_calendar(campaign_key)
+    if calendar is None:
+        logger.error(f"Кампания {campaign_key} не найдена")
+        return 0
+    gsheets = calendar.gsheets
+    
+    logger.info(f"Проверка дедлайнов ({calendar.campaign.key})...")
+    await calendar.sheets.wait_ready()
     
     # Получаем конфигурацию
-    config = gsheets.get_config()
+    config = await gsheets.get_config()
     if not config or config.get('Текущий_индекс', 0) == 0:
-        return
+        return 0
     
     current_idx = config.get('Текущий_индекс', 0)
     
     # Проверяем все активные задания для вчерашнего дня
-    progress_ws = gsheets.get_worksheet('progress')
-    all_progress = progress_ws.get_all_values()
-    
-    # Колонка для вчерашнего дня
-    yesterday_col = 3 + (current_idx - 1)  # current_idx уже увеличен на 1
+    updated = await gsheets.mark_overdue(current_idx - 1, dry_run=dry_run)  # current_idx уже увеличен на 1
     
-    updated = 0
-    for i, row in enumerate(all_progress):
-        if i == 0:  # Пропускаем заголовок
+    if dry_run:
+        logger.info(f"Проверка без записи: просроченных заданий {updated}")
+    else:
+        logger.info(f"Обновлено {updated} просроченных заданий")
+    return updated
+
+# Продолжение прерванных рассылок после перезапуска
+@bulk_job
+async def resume_broadcasts():
+    """Догнать рассылки, если бот остановился посреди них"""
+    # Рассылка завершена, но бот остановился до обновления следующей даты
+    for run in journal.unadvanced():
+        key, _, date = run.rpartition(':')
+        calendar = get_calendar(key or None)
+        if calendar is None or date not in calendar.campaign.dates:
             continue
-        
-        if yesterday_col < len(row):
-            status = row[yesterday_col]
-            if status == '⏳':
-                # Меняем на просрочено
-                progress_ws.update_cell(i + 1, yesterday_col + 1, '✖️')
-                updated += 1
-    
-    logger.info(f"Обновлено {updated} просроченных заданий")
+        logger.info(f"Обновляем следующую дату после рассылки {run}")
+        await calendar.sheets.wait_ready()
+        await advance_date(calendar, date)
+    
+    unfinished = journal.unfinished()
+    if unfinished:
+        logger.info(f"Найдены незавершенные рассылки: {', '.join(unfinished)}")
+    for key in dict.fromkeys(run.split(':')[0] for run in unfinished):
+        if get_calendar(key) is not None:
+            await send_daily_tasks(key)
+
+# Синхронизация локального хранилища с Google Таблицей
+@timed_job
+@bulk_job
+async def sync_storage():
+    """Отправка накопленных изменений в таблицы"""
+    for calendar in calendars:
+        if not calendar.sheets.is_ready():
+            continue
+        try:
+            synced = await calendar.gsheets.sync()
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации с таблицей ({calendar.campaign.key}): {e}")
+            continue
+        if synced:
+            logger.info(f"Синхронизировано изменений с таблицей ({calendar.campaign.key}): {synced}")
+
+def _trigger_key(trigger):
+    # str() без даты начала интервала, которая меняется при каждом запуске
+    return str(trigger), str(getattr(trigger, 'timezone', ''))
+
+# Задача планировщика без потери сохраненного времени запуска
+def ensure_job(scheduler, func, trigger, job_id, args=()):
+    """Добавить задачу, если её нет в базе, или обновить расписание, если оно изменилось.
+    
+    Сохраненное время следующего запуска не трогаем: пропущенный запуск
+    выполнится с учетом misfire_grace_time
+    """
+    job = scheduler.get_job(job_id)
+    if job is None:
+        return scheduler.add_job(func, trigger, args=list(args), id=job_id)
+    if _trigger_key(job.trigger) != _trigger_key(trigger):
+        return scheduler.reschedule_job(job_id, trigger=trigger)
+    return job
 
 # Основная функция
 def main():
     """Запуск бота"""
-    # Создаем Application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Создаем Application: обновления разных пользователей обрабатываются параллельно
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .build()
+    )
     
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler("start", start))
@@ -283,34 +594,86 @@ def main():
     application.add_handler(CommandHandler("выполнено", mark_done))
     application.add_handler(CommandHandler("статистика", show_stats))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("reload_tasks", reload_tasks))
+    application.add_handler(CommandHandler("cache_stats", cache_stats))
+    application.add_handler(CommandHandler("deadlines_dry_run", deadlines_dry_run))
+    application.add_handler(CommandHandler("metrics", show_metrics))
     
     # Обработчик текстовых сообщений (для ФИО)
     application.add_handler(MessageHandler(
         filters.TEXT & ~filters.COMMAND, 
         handle_name
     ))
+    application.add_error_handler(handle_error)
+    
+    # Настраиваем планировщик: задачи хранятся в базе и переживают перезапуск,
+    # пропущенный запуск выполняется один раз, если опоздание меньше MISFIRE_GRACE_TIME
+    scheduler = AsyncIOScheduler(
+        timezone=TIMEZONE,
+        jobstores={'default': SQLAlchemyJobStore(url=JOBSTORE_URL)},
+        job_defaults={
+            'misfire_grace_time': MISFIRE_GRACE_TIME,
+            'coalesce': True,
+            'max_instances': 1
+        }
+    )
+    # Стартуем на паузе: задачи в базе обновляются до того, как что-то запустится
+    scheduler.start(paused=True)
+    
+    # Задачи каждого календаря: рассылка и проверка дедлайнов в его время
+    job_ids = {'resume_broadcasts'}
+    for calendar in calendars:
+        campaign = calendar.campaign
+        for func, at in ((send_daily_tasks, campaign.send_time), (check_deadlines, campaign.check_time)):
+            hour, minute = parse_time(at)
+            job = ensure_job(
+                scheduler,
+                func,
+                CronTrigger(hour=hour, minute=minute, timezone=campaign.timezone),
+                f"{func.__name__}:{campaign.key}",
+                args=[campaign.key]
+            )
+            job_ids.add(job.id)
     
-    # Настраиваем планировщик
-    scheduler = AsyncIOScheduler(timezone=TIMEZONE)
+    # Фоновое зеркалирование локальных баз в таблицы
+    if STORAGE_BACKEND == 'sqlite':
+        ensure_job(scheduler, sync_storage, IntervalTrigger(seconds=SHEETS_SYNC_INTERVAL), 'sync_storage')
+        job_ids.add('sync_storage')
     
-    # Задача на рассылку в 18:00
-    scheduler.add_job(
-        send_daily_tasks,
-        CronTrigger(hour=18, minute=0, timezone=TIMEZONE)
-    )
+    # Задачи удаленных кампаний и прежних настроек больше не нужны
+    for job in scheduler.get_jobs():
+        if job.id not in job_ids:
+            scheduler.remove_job(job.id)
     
-    # Задача на проверку дедлайнов в 20:01
-    scheduler.add_job(
-        check_deadlines,
-        CronTrigger(hour=20, minute=1, timezone=TIMEZONE)
-    )
+    # Сразу после запуска продолжаем прерванную рассылку, если она есть
+    scheduler.add_job(resume_broadcasts, id='resume_broadcasts', replace_existing=True)
     
     # Запускаем планировщик
-    scheduler.start()
-    
-    # Запускаем бота
-    logger.info("Бот запущен...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    scheduler.resume()
+    
+    # HTTP-эндпоинт с метриками
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT, METRICS_HOST)
+    
+    # Запускаем бота: все обработчики работают только с сообщениями
+    allowed_updates = [Update.MESSAGE]
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_URL:
+            raise ValueError("Для режима webhook нужно указать WEBHOOK_URL")
+        logger.info(f"Бот запущен (webhook на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH})...")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates
+        )
+    elif BOT_MODE == 'polling':
+        logger.info("Бот запущен...")
+        application.run_polling(allowed_updates=allowed_updates)
+    else:
+        raise ValueError(f"Неизвестный режим бота: {BOT_MODE}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from config import (
+    BROADCAST_RATE, BROADCAST_CHAT_INTERVAL, BROADCAST_WORKERS, BROADCAST_MAX_RETRIES
+)
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Ограничитель частоты отправки (токен-бакет для asyncio)"""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Остановить отправку на время (после RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastStats:
+    """Статистика рассылки"""
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.latencies = []
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def duration(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self):
+        return self.sent / self.duration if self.duration > 0 else 0.0
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    def summary(self):
+        return (
+            f"отправлено {self.sent}, ошибок {self.failed}, повторов {self.retries}, "
+            f"время {self.duration:.1f} с, скорость {self.rate:.1f} сообщ/с, "
+            f"задержка p50 {self.percentile(0.5):.2f} с, p95 {self.percentile(0.95):.2f} с"
+        )
+
+
+class Broadcaster:
+    """Параллельная рассылка сообщений с учетом лимитов Telegram"""
+    def __init__(self, bot, rate=BROADCAST_RATE, chat_interval=BROADCAST_CHAT_INTERVAL,
+                 workers=BROADCAST_WORKERS, max_retries=BROADCAST_MAX_RETRIES):
+        self.bot = bot
+        self.limiter = RateLimiter(rate)
+        self.chat_interval = chat_interval
+        self.workers = workers
+        self.max_retries = max_retries
+        self.last_sent = {}
+
+    async def _wait_chat(self, chat_id):
+        """Не чаще одного сообщения в chat_interval секунд в один чат"""
+        last = self.last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def send(self, chat_id, text, stats):
+        """Отправить одно сообщение с повторами"""
+        for attempt in range(self.max_retries + 1):
+            await self._wait_chat(chat_id)
+            await self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                await self.bot.send_message(
+                    chat_id=chat_id,
+                    text=text,
+                    parse_mode=ParseMode.MARKDOWN
+                )
+                self.last_sent[chat_id] = time.monotonic()
+                stats.latencies.append(self.last_sent[chat_id] - started)
+                stats.sent += 1
+                metrics.inc('broadcast_messages_total', result='sent')
+                metrics.observe('broadcast_send_seconds', stats.latencies[-1])
+                return True
+            except RetryAfter as e:
+                # Telegram просит подождать - притормаживаем всю рассылку
+                logger.warning(f"Flood control, пауза {e.retry_after} с")
+                self.limiter.pause(e.retry_after)
+            except BadRequest as e:
+                logger.error(f"Ошибка отправки в {chat_id}: {e}")
+                break
+            except NetworkError as e:
+                logger.warning(f"Сетевая ошибка при отправке в {chat_id}: {e}")
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError as e:
+                logger.error(f"Ошибка отправки в {chat_id}: {e}")
+                break
+            stats.retries += 1
+            metrics.inc('broadcast_retries_total')
+
+        stats.failed += 1
+        metrics.inc('broadcast_messages_total', result='failed')
+        return False
+
+    async def run(self, messages, on_sent=None):
+        """Разослать список пар (chat_id, text) и вернуть статистику.
+        
+        on_sent(chat_id) вызывается после каждой успешной доставки
+        """
+        stats = BroadcastStats()
+        queue = asyncio.Queue()
+        for chat_id, text in messages:
+            queue.put_nowait((chat_id, text))
+
+        async def worker():
+            while True:
+                try:
+                    chat_id, text = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if await self.send(chat_id, text, stats) and on_sent:
+                    on_sent(chat_id)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, self.workers))))
+        stats.finished = time.monotonic()
+        metrics.set('broadcast_last_rate', round(stats.rate, 3))
+        return stats
@@ -0,0 +1,310 @@
+import threading
+import time
+
+from gspread.utils import a1_to_rowcol, absolute_range_name, numericise_all, rowcol_to_a1
+
+from config import SHEET_NAMES, CACHE_TTL
+from metrics import metrics
+from progress import ProgressMatrix
+
+# Колонки, по которым строятся индексы строк
+INDEX_COLUMNS = {
+    'users': ('ID_Telegram', 'ФИО'),
+    'schedules': ('ID_Участника', 'ФИО'),
+    'progress': ('ID_Участника', 'ФИО')
+}
+
+
+class SheetTable:
+    """Копия листа в памяти: заголовок и строки значений"""
+    def __init__(self, values, index_columns=()):
+        self.header = list(values[0]) if values else []
+        self.rows = [[str(v) for v in row] for row in values[1:]]
+        self.loaded_at = time.monotonic()
+        # Индексы: номер колонки (с 0) -> {значение: номер строки листа}
+        self.indexes = {}
+        for column in index_columns:
+            if column in self.header:
+                self._build_index(self.header.index(column))
+
+    def _build_index(self, col):
+        index = {}
+        for i, row in enumerate(self.rows):
+            if col < len(row) and row[col]:
+                index.setdefault(row[col], i + 2)
+        self.indexes[col] = index
+
+    def find_row(self, column, key):
+        """Номер строки листа по значению в индексированной колонке"""
+        if column not in self.header:
+            return None
+        col = self.header.index(column)
+        if col not in self.indexes:
+            self._build_index(col)
+        return self.indexes[col].get(str(key))
+
+    def row(self, row):
+        """Значения строки по номеру строки листа"""
+        idx = row - 2
+        if 0 <= idx < len(self.rows):
+            return self.rows[idx]
+        return []
+
+    def record(self, row):
+        """Строка в виде словаря, как в get_all_records()"""
+        values = numericise_all(list(row), empty2zero=False, default_blank="")
+        values += [''] * (len(self.header) - len(values))
+        return dict(zip(self.header, values))
+
+    def records(self):
+        return [self.record(row) for row in self.rows]
+
+    def values(self):
+        return [list(self.header)] + [list(row) for row in self.rows]
+
+    def set_cell(self, row, col, value):
+        """Записать значение по номерам строки и колонки листа (с 1)"""
+        idx = row - 2
+        if idx < 0:
+            return
+        while len(self.rows) <= idx:
+            self.rows.append([])
+        cells = self.rows[idx]
+        while len(cells) < col:
+            cells.append('')
+        old_value = cells[col - 1]
+        cells[col - 1] = str(value)
+        
+        # Поддерживаем индекс, если изменилась ключевая колонка
+        index = self.indexes.get(col - 1)
+        if index is not None and old_value != cells[col - 1]:
+            if index.get(old_value) == row:
+                del index[old_value]
+            if cells[col - 1] and (cells[col - 1] not in index or index[cells[col - 1]] > row):
+                index[cells[col - 1]] = row
+
+    def append(self, values):
+        self.rows.append([str(v) for v in values])
+        row = len(self.rows) + 1
+        for col, index in self.indexes.items():
+            if col < len(values) and str(values[col]):
+                index.setdefault(str(values[col]), row)
+        return row
+
+
+class ProgressTable(SheetTable):
+    """Лист прогресса: строки и компактная матрица статусов, изменяемые вместе"""
+    def __init__(self, values, index_columns=()):
+        super().__init__(values, index_columns)
+        self.matrix = ProgressMatrix.from_values([self.header] + self.rows)
+
+    def set_cell(self, row, col, value):
+        super().set_cell(row, col, value)
+        if row >= 2:
+            self.matrix.set_value(row - 2, col, value)
+
+    def append(self, values):
+        row = super().append(values)
+        self.matrix.append_values(values)
+        return row
+
+
+# Листы со своим представлением в памяти
+TABLE_CLASSES = {
+    'progress': ProgressTable
+}
+
+
+class SheetCache:
+    """Кэш листов таблицы в памяти с TTL и сквозной записью"""
+    def __init__(self, get_worksheet, ttl=None, request=None, on_load=None):
+        self.get_worksheet = get_worksheet
+        # Вызывается с именем листа после каждой загрузки из таблицы
+        self.on_load = on_load
+        # Обертка для сетевых запросов (квоты, повторы)
+        self.request = request or (lambda func, *args, idempotent=True, **kwargs: func(*args, **kwargs))
+        self.ttl = dict(CACHE_TTL if ttl is None else ttl)
+        self.tables = {}
+        self.hits = {name: 0 for name in SHEET_NAMES}
+        self.misses = {name: 0 for name in SHEET_NAMES}
+        # Общая блокировка защищает только данные в памяти и никогда не держится
+        # во время запросов к API. Загрузка и добавление строк идут под блокировкой
+        # своего листа: запрос может долго ждать квоту или повтора
+        self.lock = threading.RLock()
+        self.sheet_locks = {name: threading.RLock() for name in SHEET_NAMES}
+        # Счетчики изменений листов: по ним видно, что лист менялся во время загрузки
+        self.writes = {name: 0 for name in SHEET_NAMES}
+
+    def _is_fresh(self, name, table):
+        ttl = self.ttl.get(name, 0)
+        return ttl > 0 and time.monotonic() - table.loaded_at < ttl
+
+    def _cached(self, name):
+        """Свежая копия листа из кэша или None (под self.lock)"""
+        table = self.tables.get(name)
+        if table is not None and self._is_fresh(name, table):
+            self.hits[name] += 1
+            metrics.inc('sheet_cache_hits_total', sheet=name)
+            return table
+        return None
+
+    def table(self, name):
+        """Получить лист из кэша, загрузив его при необходимости"""
+        with self.lock:
+            table = self._cached(name)
+        if table is not None:
+            return table
+        
+        with self.sheet_locks[name]:
+            # Пока ждали, лист мог загрузить другой поток
+            with self.lock:
+                table = self._cached(name)
+                if table is not None:
+                    return table
+                self.misses[name] += 1
+                metrics.inc('sheet_cache_misses_total', sheet=name)
+                writes = self.writes[name]
+            
+            table = TABLE_CLASSES.get(name, SheetTable)(
+                self.request(self.get_worksheet(name).get_all_values),
+                INDEX_COLUMNS.get(name, ())
+            )
+            with self.lock:
+                if self.writes[name] != writes:
+                    # Лист меняли во время загрузки: копию используем, но при
+                    # следующем обращении перечитаем
+                    table.loaded_at = float('-inf')
+                self.tables[name] = table
+        if self.on_load is not None:
+            self.on_load(name)
+        return table
+
+    def records(self, name):
+        """Аналог get_all_records() из кэша"""
+        table = self.table(name)
+        with self.lock:
+            return table.records()
+
+    def values(self, name):
+        """Аналог get_all_values() из кэша"""
+        table = self.table(name)
+        with self.lock:
+            return table.values()
+
+    def find_row(self, name, column, key):
+        """Найти номер строки листа по ключу через индекс"""
+        table = self.table(name)
+        with self.lock:
+            return table.find_row(column, key)
+
+    def matrix(self, name='progress'):
+        """Матрица прогресса из кэша листа"""
+        return self.table(name).matrix
+
+    def row(self, name, row):
+        """Значения строки листа по её номеру"""
+        table = self.table(name)
+        with self.lock:
+            return list(table.row(row))
+
+    def record(self, name, row):
+        """Строка листа по её номеру в виде словаря"""
+        table = self.table(name)
+        with self.lock:
+            return table.record(table.row(row))
+
+    def read_range(self, name, a1_range):
+        """Прочитать диапазон напрямую из таблицы, минуя кэш"""
+        return self.request(self.get_worksheet(name).get, a1_range)
+
+    def update_cell(self, name, row, col, value):
+        """Записать ячейку в таблицу и в кэш"""
+        # Сам запрос идет без блокировки, чтобы не задерживать чтения из кэша
+        self.request(self.get_worksheet(name).update_cell, row, col, value)
+        with self.lock:
+            self.writes[name] += 1
+            table = self.tables.get(name)
+            if table is not None:
+                table.set_cell(row, col, value)
+
+    def batch_update(self, name, data):
+        """Записать несколько диапазонов одним запросом и обновить кэш"""
+        self.request(
+            self.get_worksheet(name).batch_update, data, value_input_option='USER_ENTERED'
+        )
+        with self.lock:
+            self.writes[name] += 1
+            table = self.tables.get(name)
+            if table is not None:
+                for item in data:
+                    start = item['range'].split(':')[0]
+                    row, col = a1_to_rowcol(start)
+                    for i, values in enumerate(item['values']):
+                        for j, value in enumerate(values):
+                            table.set_cell(row + i, col + j, value)
+
+    def multi_update(self, updates):
+        """Записать строки на разных листах одним запросом.
+        
+        updates - список (лист, строка, первая колонка, значения)
+        """
+        if not updates:
+            return
+        data = [
+            {
+                'range': absolute_range_name(SHEET_NAMES[name], rowcol_to_a1(row, col)),
+                'values': [list(values)]
+            }
+            for name, row, col, values in updates
+        ]
+        spreadsheet = self.get_worksheet(updates[0][0]).spreadsheet
+        self.request(
+            spreadsheet.values_batch_update,
+            body={'valueInputOption': 'USER_ENTERED', 'data': data}
+        )
+        with self.lock:
+            for name, row, col, values in updates:
+                self.writes[name] += 1
+                table = self.tables.get(name)
+                if table is not None:
+                    for i, value in enumerate(values):
+                        table.set_cell(row, col + i, value)
+
+    def append_row(self, name, values):
+        """Добавить строку в таблицу и в кэш"""
+        # Добавление - под блокировкой листа: от порядка строк зависят номера в индексах.
+        # При неясном исходе (5xx, таймаут) не повторяем, чтобы не задублировать строку
+        with self.sheet_locks[name]:
+            self.request(self.get_worksheet(name).append_row, values, idempotent=False)
+            with self.lock:
+                table = self.tables.get(name)
+                if table is not None:
+                    table.append(values)
+
+    def append_rows(self, name, rows):
+        """Добавить несколько строк одним запросом"""
+        with self.sheet_locks[name]:
+            self.request(self.get_worksheet(name).append_rows, rows, idempotent=False)
+            with self.lock:
+                table = self.tables.get(name)
+                if table is not None:
+                    for values in rows:
+                        table.append(values)
+
+    def invalidate(self, name=None):
+        """Сбросить кэш одного листа или всех листов"""
+        with self.lock:
+            for sheet in (SHEET_NAMES if name is None else [name]):
+                self.writes[sheet] += 1
+            if name is None:
+                self.tables.clear()
+            else:
+                self.tables.pop(name, None)
+
+    def stats(self):
+        """Счетчики попаданий и промахов по листам"""
+        with self.lock:
+            return {
+                name: {'hits': self.hits[name], 'misses': self.misses[name]}
+                for name in SHEET_NAMES
+            }
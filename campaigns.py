@@ -0,0 +1,81 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytz
+
+from config import (
+    CAMPAIGNS_FILE, GOOGLE_SHEET_ID, DATES, SEND_TIME, DEADLINE_TIME, CHECK_DEADLINE_TIME,
+    TIMEZONE, SQLITE_PATH
+)
+
+
+def parse_time(value):
+    """'18:00' -> (18, 0)"""
+    hour, minute = map(int, value.split(':'))
+    return hour, minute
+
+
+class Campaign:
+    """Один календарь: даты, время рассылки и дедлайна, своя таблица"""
+    def __init__(self, key, sheet_id, dates, title=None, send_time=SEND_TIME,
+                 deadline_time=DEADLINE_TIME, check_time=CHECK_DEADLINE_TIME,
+                 first_send_date=None, timezone=TIMEZONE, sqlite_path=None):
+        self.key = key
+        self.title = title or key
+        self.sheet_id = sheet_id
+        self.dates = list(dates)
+        self.send_time = send_time
+        self.deadline_time = deadline_time
+        self.check_time = check_time
+        self.timezone = timezone
+        self.sqlite_path = sqlite_path or f"advent-{key}.sqlite3"
+        # Задание первого дня рассылается накануне
+        if first_send_date is None:
+            first_send_date = (
+                datetime.strptime(self.dates[0], '%d.%m.%Y') - timedelta(days=1)
+            ).strftime('%d.%m.%Y')
+        self.first_send_date = first_send_date
+
+    @property
+    def days(self):
+        return len(self.dates)
+
+    def send_date(self, date_index):
+        """Дата рассылки задания дня date_index (накануне)"""
+        if date_index > 0:
+            return self.dates[date_index - 1]
+        return self.first_send_date
+
+    def now(self):
+        return datetime.now(pytz.timezone(self.timezone))
+
+    def before_deadline(self, now=None):
+        """Не наступил ли еще дедлайн сегодняшнего дня"""
+        now = now or self.now()
+        hour, minute = parse_time(self.deadline_time)
+        return now <= now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+
+def load_campaigns(path=CAMPAIGNS_FILE):
+    """Кампании из JSON-файла или одна кампания из настроек config.py.
+
+    Формат файла - список объектов с полями key, sheet_id, dates и
+    необязательными title, send_time, deadline_time, check_time,
+    first_send_date, timezone, sqlite_path
+    """
+    if not path or not os.path.exists(path):
+        return [Campaign(
+            'default', GOOGLE_SHEET_ID, DATES, title='Advent Calendar 2025', sqlite_path=SQLITE_PATH
+        )]
+
+    with open(path, encoding='utf-8') as f:
+        items = json.load(f)
+
+    campaigns = []
+    for item in items:
+        campaigns.append(Campaign(**item))
+    keys = [campaign.key for campaign in campaigns]
+    if not campaigns or len(set(keys)) != len(keys):
+        raise ValueError(f"В {path} должны быть кампании с уникальными key")
+    return campaigns
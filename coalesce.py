@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from metrics import metrics
+
+# Как часто чистить устаревшие результаты (по числу сохранений)
+PRUNE_EVERY = 1000
+
+
+class Coalescer:
+    """Объединение повторных команд пользователя.
+
+    Одновременные одинаковые команды ждут одно общее вычисление,
+    а повтор в течение окна получает последний результат
+    """
+    def __init__(self, windows):
+        self.windows = dict(windows)
+        self.inflight = {}
+        self.recent = {}
+        self.stored = 0
+        self.counters = {}
+
+    def _count(self, command, kind):
+        counters = self.counters.setdefault(command, {'calls': 0, 'joined': 0, 'reused': 0})
+        counters[kind] += 1
+        if kind != 'calls':
+            metrics.inc('coalesced_commands_total', command=command, kind=kind)
+
+    async def run(self, command, user_id, func, *args):
+        """Выполнить func(*args) или вернуть результат такой же команды пользователя"""
+        key = (command, user_id)
+        recent = self.recent.get(key)
+        if recent is not None and recent[0] > time.monotonic():
+            self._count(command, 'reused')
+            return recent[1]
+
+        future = self.inflight.get(key)
+        if future is not None:
+            self._count(command, 'joined')
+            return await asyncio.shield(future)
+
+        self._count(command, 'calls')
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие; если их нет, не выводим предупреждение
+            future.exception()
+            raise
+        finally:
+            del self.inflight[key]
+
+        future.set_result(result)
+        window = self.windows.get(command, 0)
+        if window > 0:
+            self._store(key, time.monotonic() + window, result)
+        return result
+
+    def _store(self, key, expires, result):
+        self.recent[key] = (expires, result)
+        self.stored += 1
+        if self.stored % PRUNE_EVERY == 0:
+            now = time.monotonic()
+            self.recent = {k: v for k, v in self.recent.items() if v[0] > now}
+
+    def invalidate(self, user_id, command=None):
+        """Забыть сохраненные результаты пользователя (одной команды или всех)"""
+        for key in [k for k in self.recent if k[1] == user_id and (command is None or k[0] == command)]:
+            del self.recent[key]
+
+    def stats(self):
+        """Счетчики по командам: выполнено, присоединились к выполняемой, взяли готовый результат"""
+        return {command: dict(counters) for command, counters in self.counters.items()}
@@ -9,6 +9,34 @@ TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 GOOGLE_SHEET_ID = os.getenv('GOOGLE_SHEET_ID')
 TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow')
 
+# Режим получения обновлений: 'polling' или 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # внешний адрес, например https://bot.example.com
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+
+# Сколько обновлений обрабатывать одновременно
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '32'))
+
+# Подключение к хранилищу при старте: максимальная пауза между попытками, секунды
+STARTUP_RETRY_MAX = int(os.getenv('STARTUP_RETRY_MAX', '60'))
+
+# Telegram ID организаторов через запятую
+ADMIN_IDS = [int(x) for x in os.getenv('ADMIN_IDS', '').split(',') if x.strip()]
+
+# Хранилище данных: 'sheets' - напрямую Google Таблица,
+# 'sqlite' - локальная база с зеркалированием в таблицу
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sheets')
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'advent.sqlite3')
+SHEETS_SYNC_INTERVAL = int(os.getenv('SHEETS_SYNC_INTERVAL', '15'))  # секунды
+SHEETS_SYNC_BATCH = 1000  # изменений за одну синхронизацию
+
+# Файл с описанием нескольких календарей (кампаний); если его нет,
+# работает один календарь с таблицей GOOGLE_SHEET_ID и датами ниже
+CAMPAIGNS_FILE = os.getenv('CAMPAIGNS_FILE', 'campaigns.json')
+
 # Даты календаря
 DATES = [
     '17.12.2025',
@@ -24,6 +52,14 @@ DATES = [
 SEND_TIME = "18:00"  # Время рассылки
 DEADLINE_TIME = "20:00"  # Дедлайн
 CHECK_DEADLINE_TIME = "20:01"  # Проверка дедлайнов
+DEADLINE_DRY_RUN = os.getenv('DEADLINE_DRY_RUN', '') == '1'  # только отчет, без записи
+
+# Планировщик: хранилище задач и сколько секунд после пропуска задачу еще можно выполнить
+JOBSTORE_URL = os.getenv('JOBSTORE_URL', 'sqlite:///jobs.sqlite3')
+MISFIRE_GRACE_TIME = int(os.getenv('MISFIRE_GRACE_TIME', '7200'))
+
+# Журнал доставки рассылок (для продолжения после перезапуска)
+BROADCAST_JOURNAL_PATH = os.getenv('BROADCAST_JOURNAL_PATH', 'broadcast.sqlite3')
 
 # Имена листов в Google Таблице
 SHEET_NAMES = {
@@ -33,3 +69,46 @@ SHEET_NAMES = {
     'progress': 'Прогресс',
     'config': 'Конфиг'
 }
+
+# Время жизни кэша листов в секундах (0 - не кэшировать)
+CACHE_TTL = {
+    'users': 60,
+    'tasks': 600,
+    'schedules': 300,
+    'progress': 60,
+    'config': 30
+}
+
+# Окна объединения повторных команд пользователя, секунды (0 - только одновременные)
+COALESCE_WINDOWS = {
+    'выполнено': float(os.getenv('COALESCE_DONE_WINDOW', '3')),
+    'расписание': float(os.getenv('COALESCE_SCHEDULE_WINDOW', '2'))
+}
+
+# Максимум диапазонов в одном batch_update
+BATCH_MAX_RANGES = 500
+
+# Рассылка: лимит Telegram ~30 сообщений в секунду, не чаще 1 сообщения в секунду в чат
+BROADCAST_RATE = int(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_CHAT_INTERVAL = 1.0
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '16'))
+BROADCAST_MAX_RETRIES = 3
+
+# Пул потоков для запросов к Google Sheets
+SHEETS_WORKERS = int(os.getenv('SHEETS_WORKERS', '8'))
+SHEETS_MAX_CONCURRENCY = int(os.getenv('SHEETS_MAX_CONCURRENCY', '4'))
+
+# Соединения с Google API
+SHEETS_POOL_SIZE = int(os.getenv('SHEETS_POOL_SIZE', '10'))
+CREDENTIALS_REFRESH_MARGIN = 300  # обновлять токен за 5 минут до истечения
+
+# Квота Sheets API: запросов в минуту, допустимый всплеск, повторы при 429/5xx
+SHEETS_QUOTA_PER_MINUTE = int(os.getenv('SHEETS_QUOTA_PER_MINUTE', '60'))
+SHEETS_QUOTA_BURST = 10
+SHEETS_MAX_RETRIES = 5
+SHEETS_BACKOFF_BASE = 1.0  # секунды
+SHEETS_BACKOFF_MAX = 32.0
+
+# Метрики: порт HTTP-эндпоинта /metrics (0 - не запускать)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
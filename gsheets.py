@@ -1,113 +1,309 @@
 import gspread
+import logging
+from google.auth.transport.requests import AuthorizedSession, Request
 from google.oauth2.service_account import Credentials
-from config import GOOGLE_SHEET_ID, SHEET_NAMES, DATES
+from gspread.utils import rowcol_to_a1
+from requests.adapters import HTTPAdapter
+from config import SHEET_NAMES, SHEETS_POOL_SIZE, CREDENTIALS_REFRESH_MARGIN
+from batch import BatchWriter
+from cache import SheetCache
+from campaigns import load_campaigns
+from locks import KeyedLocks
+from metrics import instrument
+from quota import RequestScheduler
+from storage import Storage
+from tasks import TaskCatalog
 import random
-from datetime import datetime
-import pytz
+import threading
+from datetime import datetime, timedelta
 
-class GoogleSheets:
-    def __init__(self):
+logger = logging.getLogger(__name__)
+
+
+class SheetsConnection:
+    """Подключение к Google API: учетные данные, пул соединений и планировщик квоты.
+    
+    Одно подключение обслуживает таблицы всех кампаний
+    """
+    def __init__(self, client=None, requests=None):
+        # Все запросы к API идут через общий планировщик квоты
+        self.requests = requests or RequestScheduler()
+        self.creds_lock = threading.Lock()
+        
+        if client is not None:
+            # Готовый клиент gspread (например, имитация таблицы в бенчмарках)
+            self.creds = None
+            self.client = client
+            return
+        
         # Настройка доступа к Google Sheets
         scopes = [
             'https://www.googleapis.com/auth/spreadsheets',
             'https://www.googleapis.com/auth/drive'
         ]
-        creds = Credentials.from_service_account_file(
+        self.creds = Credentials.from_service_account_file(
             'credentials.json', 
             scopes=scopes
         )
-        self.client = gspread.authorize(creds)
-        self.sheet = self.client.open_by_key(GOOGLE_SHEET_ID)
+        
+        # Один пул keep-alive соединений на все запросы к API
+        self.auth_request = Request()
+        self.session = AuthorizedSession(self.creds, auth_request=self.auth_request)
+        adapter = HTTPAdapter(pool_connections=SHEETS_POOL_SIZE, pool_maxsize=SHEETS_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.client = gspread.Client(auth=self.creds, session=self.session)
+    
+    def open(self, sheet_id):
+        """Открыть таблицу по ID"""
+        return self.requests.call(self.client.open_by_key, sheet_id)
+    
+    def refresh_credentials(self):
+        """Обновить токен заранее, не дожидаясь ответа 401"""
+        if self.creds is None:
+            return
+        expiry = self.creds.expiry
+        margin = timedelta(seconds=CREDENTIALS_REFRESH_MARGIN)
+        if self.creds.token and expiry and expiry - datetime.utcnow() > margin:
+            return
+        with self.creds_lock:
+            expiry = self.creds.expiry
+            if not self.creds.token or not expiry or expiry - datetime.utcnow() <= margin:
+                self.creds.refresh(self.auth_request)
+
+
+_connection = None
+_connection_lock = threading.Lock()
+
+
+def shared_connection():
+    """Общее на процесс подключение к Google API"""
+    global _connection
+    with _connection_lock:
+        if _connection is None:
+            _connection = SheetsConnection()
+        return _connection
+
+
+@instrument
+class GoogleSheets(Storage):
+    def __init__(self, campaign=None, client=None, requests=None, connection=None):
+        super().__init__()
+        self.campaign = campaign or load_campaigns()[0]
+        if connection is None:
+            connection = SheetsConnection(client, requests) if client is not None else shared_connection()
+        self.connection = connection
+        self.requests = connection.requests
+        
+        self.sheet = connection.open(self.campaign.sheet_id)
+        self.worksheets = {}
+        self.worksheets_lock = threading.Lock()
+        self.cache = SheetCache(self.get_worksheet, request=self.requests.call, on_load=self._sheet_loaded)
+        self.tasks = TaskCatalog()
+        self.user_locks = KeyedLocks()
+        self.reload_tasks()
         
     def get_worksheet(self, name):
         """Получить лист по имени"""
-        return self.sheet.worksheet(SHEET_NAMES[name])
+        self.connection.refresh_credentials()
+        worksheet = self.worksheets.get(name)
+        if worksheet is not None:
+            return worksheet
+        
+        with self.worksheets_lock:
+            if name not in self.worksheets:
+                # Все листы получаем одним запросом метаданных
+                by_title = {ws.title: ws for ws in self.requests.call(self.sheet.worksheets)}
+                for key, title in SHEET_NAMES.items():
+                    if title in by_title:
+                        self.worksheets[key] = by_title[title]
+            if name not in self.worksheets:
+                self.worksheets[name] = self.requests.call(self.sheet.worksheet, SHEET_NAMES[name])
+            return self.worksheets[name]
+    
+    def _sheet_loaded(self, name):
+        # Лист перечитан из таблицы (истек TTL, его могли поправить вручную):
+        # готовые ответы пользователям могли устареть
+        if name in ('progress', 'schedules'):
+            self._touch()
+    
+    def request_stats(self):
+        """Счетчики запросов к Sheets API"""
+        return self.requests.stats()
+    
+    def sheet_cache_stats(self):
+        """Попадания и промахи кэша листов"""
+        return self.cache.stats()
+    
+    def batch(self, name):
+        """Накопитель изменений листа для записи одним запросом"""
+        return BatchWriter(self.cache, name)
+    
+    def reload_tasks(self):
+        """Перезагрузить каталог заданий из таблицы"""
+        self.cache.invalidate('tasks')
+        count = self.tasks.load(self.cache.records('tasks'))
+        # В готовых расписаниях могут быть старые тексты заданий
+        self._touch()
+        return count
     
     def register_user(self, user_id, full_name):
         """Регистрация нового пользователя"""
-        users_ws = self.get_worksheet('users')
-        schedules_ws = self.get_worksheet('schedules')
-        progress_ws = self.get_worksheet('progress')
-        tasks_ws = self.get_worksheet('tasks')
-        
-        # Проверяем, есть ли уже пользователь
-        try:
-            users = users_ws.get_all_records()
-            for user in users:
-                if user.get('ФИО') == full_name:
-                    # Обновляем Telegram ID если ФИО уже есть
-                    row_idx = users.index(user) + 2
-                    users_ws.update_cell(row_idx, 1, str(user_id))
-                    users_ws.update_cell(row_idx, 2, full_name)
-                    users_ws.update_cell(row_idx, 3, 'активен')
-                    return f"Добро пожаловать обратно, {full_name}!"
-        except Exception as e:
-            print(f"Ошибка при проверке пользователя: {e}")
+        # Обработчики сообщений работают параллельно: поиск и добавление строк одного
+        # участника выполняем по очереди, иначе два одинаковых сообщения добавят его дважды.
+        # Блокировки берем всегда в одном порядке: сначала по ID, потом по ФИО
+        with self.user_locks.hold(str(user_id)), self.user_locks.hold(f"ФИО:{full_name}"):
+            return self._register_user(user_id, full_name)
+    
+    def _register_user(self, user_id, full_name):
+        # Проверяем, есть ли уже пользователь. Ошибки не глушим: иначе при сбое
+        # привязки участник был бы добавлен второй раз
+        row_idx = self.cache.find_row('users', 'ФИО', full_name)
+        if row_idx:
+            logger.info(f"Привязываем Telegram ID {user_id} к участнику {full_name}")
+            return self._bind_user(row_idx, user_id, full_name)
+        
+        # Выбираем уникальные случайные задания на все дни
+        selected_tasks = self._generate_schedule()
         
         # Добавляем нового пользователя
-        users_ws.append_row([
+        self.cache.append_row('users', [
             str(user_id), 
             full_name, 
             'активен',
             datetime.now().strftime('%d.%m.%Y')
         ])
         
-        # Получаем все задания
-        all_tasks = tasks_ws.get_all_records()
-        task_ids = [task['ID_Задания'] for task in all_tasks]
-        
-        # Выбираем 7 уникальных случайных заданий
-        if len(task_ids) < 7:
-            return "Ошибка: В базе меньше 7 заданий"
-        selected_tasks = random.sample(task_ids, 7)
+        if selected_tasks is None:
+            return f"Ошибка: В базе меньше {self.campaign.days} заданий"
         
         # Создаем расписание
         schedule_row = [str(user_id), full_name] + selected_tasks
-        schedules_ws.append_row(schedule_row)
+        self.cache.append_row('schedules', schedule_row)
         
         # Создаем прогресс
-        progress_row = [str(user_id), full_name, 0] + ['➖'] * 7 + [0]
-        progress_ws.append_row(progress_row)
+        progress_row = self.progress_matrix().blank_row(str(user_id), full_name)
+        self.cache.append_row('progress', progress_row)
+        self._touch(user_id)
+        
+        return self._welcome(full_name)
+    
+    def _generate_schedule(self):
+        """Случайные уникальные задания на все дни или None, если заданий мало"""
+        task_ids = self.tasks.ids()
+        if len(task_ids) < self.campaign.days:
+            return None
+        return random.sample(task_ids, self.campaign.days)
+    
+    def _bind_user(self, user_row, user_id, full_name):
+        """Привязать Telegram ID к заранее созданным строкам участника"""
+        old_id = self.cache.row('users', user_row)[:1]
+        schedule_row = self.cache.find_row('schedules', 'ФИО', full_name)
+        progress_row = self.cache.find_row('progress', 'ФИО', full_name)
+        
+        # Все листы обновляем одним запросом
+        updates = [('users', user_row, 1, [str(user_id), full_name, 'активен'])]
+        if schedule_row:
+            updates.append(('schedules', schedule_row, 1, [str(user_id)]))
+        if progress_row:
+            updates.append(('progress', progress_row, 1, [str(user_id)]))
+        self.cache.multi_update(updates)
+        
+        # Участник есть в списке, но расписание для него еще не создано
+        if not schedule_row or not progress_row:
+            selected_tasks = self._generate_schedule()
+            if selected_tasks is None:
+                return f"Ошибка: В базе меньше {self.campaign.days} заданий"
+            if not schedule_row:
+                self.cache.append_row('schedules', [str(user_id), full_name] + selected_tasks)
+            if not progress_row:
+                self.cache.append_row('progress', self.progress_matrix().blank_row(str(user_id), full_name))
+        self._touch(user_id)
+        
+        if old_id and old_id[0]:
+            return f"Добро пожаловать обратно, {full_name}!"
+        return self._welcome(full_name)
+    
+    def import_participants(self, names=None):
+        """Массовая регистрация участников по списку ФИО"""
+        # Строки создаются заранее без Telegram ID, /start потом только привязывает ID.
+        # Без списка берем участников с листа «Участники»
+        if names is None:
+            names = [user.get('ФИО', '') for user in self.cache.records('users')]
+        
+        if self._generate_schedule() is None:
+            raise ValueError(f"В базе меньше {self.campaign.days} заданий")
+        
+        today = datetime.now().strftime('%d.%m.%Y')
+        rows = {'users': [], 'schedules': [], 'progress': []}
+        seen = set()
+        for name in names:
+            name = str(name).strip()
+            if not name or name in seen:
+                continue
+            seen.add(name)
+            
+            # Если участник уже привязал Telegram ID, строки создаем сразу под ним
+            telegram_id = ''
+            user_row = self.cache.find_row('users', 'ФИО', name)
+            if user_row:
+                user = self.cache.row('users', user_row)
+                telegram_id = user[0] if user else ''
+            else:
+                rows['users'].append(['', name, 'ожидает', today])
+            if not self.cache.find_row('schedules', 'ФИО', name):
+                rows['schedules'].append([telegram_id, name] + self._generate_schedule())
+            if not self.cache.find_row('progress', 'ФИО', name):
+                rows['progress'].append(self.progress_matrix().blank_row(telegram_id, name))
         
-        return f"Регистрация успешна, {full_name}! Первое задание получите 16.12 в 18:00."
+        # Каждый лист пишем одним запросом
+        for sheet, sheet_rows in rows.items():
+            if sheet_rows:
+                self.cache.append_rows(sheet, sheet_rows)
+        return {sheet: len(sheet_rows) for sheet, sheet_rows in rows.items()}
+    
+    def has_user(self, user_id):
+        """Зарегистрирован ли пользователь с этим Telegram ID"""
+        return self.progress_matrix().slot(user_id) is not None
+    
+    def has_participant(self, full_name):
+        """Есть ли участник с таким ФИО в списке"""
+        return self.cache.find_row('users', 'ФИО', full_name) is not None
+    
+    def progress_matrix(self):
+        """Матрица прогресса, которая ведется вместе с кэшем листа"""
+        return self.cache.matrix('progress')
     
     def get_user_progress(self, user_id):
         """Получить прогресс пользователя"""
-        progress_ws = self.get_worksheet('progress')
-        all_progress = progress_ws.get_all_records()
-        
-        for progress in all_progress:
-            if str(progress.get('ID_Участника', '')) == str(user_id):
-                return progress
-        return None
+        matrix = self.progress_matrix()
+        slot = matrix.slot(user_id)
+        if slot is None:
+            return None
+        return matrix.record(slot)
     
     def get_user_schedule(self, user_id):
         """Получить расписание пользователя"""
-        schedules_ws = self.get_worksheet('schedules')
-        all_schedules = schedules_ws.get_all_records()
-        
-        for schedule in all_schedules:
-            if str(schedule.get('ID_Участника', '')) == str(user_id):
-                return schedule
+        row = self.cache.find_row('schedules', 'ID_Участника', user_id)
+        if row:
+            return self.cache.record('schedules', row)
         return None
     
+    def get_all_schedules(self):
+        """Получить расписания всех пользователей по ID_Участника"""
+        return {
+            str(schedule.get('ID_Участника')): schedule
+            for schedule in self.cache.records('schedules')
+            if schedule.get('ID_Участника') != ''
+        }
+    
     def get_task_text(self, task_id):
         """Получить текст задания по ID"""
-        tasks_ws = self.get_worksheet('tasks')
-        all_tasks = tasks_ws.get_all_records()
-        
-        for task in all_tasks:
-            if task.get('ID_Задания') == task_id:
-                return task.get('Текст_задания', 'Задание не найдено')
-        return "Задание не найдено"
+        return self.tasks.text(task_id)
     
     def mark_task_done(self, user_id):
         """Отметить задание как выполненное"""
-        progress_ws = self.get_worksheet('progress')
-        config_ws = self.get_worksheet('config')
-        
         # Получаем текущий индекс
-        config = config_ws.get_all_records()
+        config = self.cache.records('config')
         if not config:
             return "Календарь еще не начался"
         
@@ -116,78 +312,94 @@ class GoogleSheets:
         if current_idx == 0:
             return "Календарь еще не начался"
         
-        # Находим пользователя
-        all_progress = progress_ws.get_all_values()
-        user_row = None
-        for i, row in enumerate(all_progress):
-            if i == 0:  # Пропускаем заголовок
-                continue
-            if row[0] == str(user_id):
-                user_row = i + 1
-                break
-        
-        if not user_row:
-            return "Пользователь не найден"
-        
-        # Проверяем статус текущего задания
-        status_col = 3 + current_idx  # Смещение для статуса
-        current_status = progress_ws.cell(user_row, status_col).value
-        
-        # Получаем текущее время
-        tz = pytz.timezone('Europe/Moscow')
-        now = datetime.now(tz)
-        deadline_time = now.replace(hour=20, minute=0, second=0, microsecond=0)
-        
-        if current_status == '⏳':
-            if now <= deadline_time:
-                # Отмечаем как выполненное
-                progress_ws.update_cell(user_row, status_col, '✅')
-                
-                # Увеличиваем счетчик выполненных
-                done_count = int(progress_ws.cell(user_row, 11).value or 0)
-                progress_ws.update_cell(user_row, 11, done_count + 1)
-                
-                return "✅ Задание отмечено как выполненное!"
+        # Одновременные отметки одного пользователя выполняем по очереди,
+        # чтобы счетчик не потерял увеличение
+        with self.user_locks.hold(str(user_id)):
+            # Одно чтение свежей строки пользователя (current_idx уже увеличен на 1)
+            row = self._read_progress_row(user_id)
+            if row is None:
+                return "Пользователь не найден"
+            user_row, row = row
+            # Колонки - по заголовку листа, как и при чтении в матрицу
+            matrix = self.progress_matrix()
+            col = matrix.status_column(current_idx - 1)
+            done_col = matrix.done_column()
+            current_status = row[col - 1] if col <= len(row) else ''
+            
+            if current_status == '⏳':
+                if self.campaign.before_deadline():
+                    # Статус и счетчик выполненных пишем одним запросом
+                    done_count = int(row[done_col - 1] or 0) if len(row) >= done_col else 0
+                    with self.batch('progress') as batch:
+                        batch.set(user_row, col, '✅')
+                        batch.set(user_row, done_col, done_count + 1)
+                    self._update_leaderboard(user_id, row[1], done_count + 1)
+                    self._touch(user_id)
+                    
+                    return "✅ Задание отмечено как выполненное!"
+                else:
+                    return "⏰ Время вышло! Задание уже нельзя отметить."
+            elif current_status == '✅':
+                return "✅ Это задание уже выполнено!"
             else:
-                return "⏰ Время вышло! Задание уже нельзя отметить."
-        elif current_status == '✅':
-            return "✅ Это задание уже выполнено!"
-        else:
-            return "📭 Сейчас нет активного задания для отметки."
+                return "📭 Сейчас нет активного задания для отметки."
+    
+    def _read_progress_row(self, user_id):
+        """Свежая строка прогресса пользователя: (номер строки, значения) или None.
+        
+        Номер строки берется из кэша, а лист могли отсортировать или вставить в него
+        строки, поэтому сверяем ID в прочитанной строке и при расхождении
+        перечитываем лист
+        """
+        for attempt in range(2):
+            user_row = self.cache.find_row('progress', 'ID_Участника', user_id)
+            if not user_row:
+                return None
+            matrix = self.progress_matrix()
+            last_col = rowcol_to_a1(1, max(matrix.status_cols + [matrix.done_col]) + 1)[:-1]
+            cells = self.cache.read_range('progress', f"A{user_row}:{last_col}{user_row}")
+            row = cells[0] if cells else []
+            if row and row[0] == str(user_id):
+                return user_row, row
+            logger.warning(f"Строка {user_row} листа прогресса больше не принадлежит {user_id}, перечитываем лист")
+            self.cache.invalidate('progress')
+        return None
     
     def get_next_date(self):
         """Получить следующую дату для рассылки"""
-        config_ws = self.get_worksheet('config')
-        config = config_ws.get_all_records()
+        config = self.cache.records('config')
         if config:
             return config[0].get('Следующая_дата')
         return None
     
     def update_next_date(self):
         """Обновить следующую дату"""
-        config_ws = self.get_worksheet('config')
-        config = config_ws.get_all_records()
+        config = self.cache.records('config')
         
         if not config:
             # Инициализация
-            config_ws.append_row(['Следующая_дата', 'Текущий_индекс', 'Дата_последней_рассылки'])
-            config_ws.append_row(['17.12.2025', 0, ''])
+            self.cache.append_rows('config', [
+                ['Следующая_дата', 'Текущий_индекс', 'Дата_последней_рассылки'],
+                [self.campaign.dates[0], 0, '']
+            ])
+            self.cache.invalidate('config')
         else:
             current_idx = config[0].get('Текущий_индекс', 0)
+            dates = self.campaign.dates
             
-            if current_idx < len(DATES):
+            if current_idx < len(dates):
                 # Обновляем индекс
-                config_ws.update_cell(2, 2, current_idx + 1)
+                self.cache.update_cell('config', 2, 2, current_idx + 1)
                 
-                if current_idx + 1 < len(DATES):
+                if current_idx + 1 < len(dates):
                     # Обновляем следующую дату
-                    next_date = DATES[current_idx + 1]
-                    config_ws.update_cell(2, 1, next_date)
+                    next_date = dates[current_idx + 1]
+                    self.cache.update_cell('config', 2, 1, next_date)
+        self._touch()
     
     def get_all_active_users(self):
         """Получить всех активных пользователей"""
-        users_ws = self.get_worksheet('users')
-        users = users_ws.get_all_records()
+        users = self.cache.records('users')
         
         active_users = []
         for user in users:
@@ -198,25 +410,80 @@ class GoogleSheets:
                 })
         return active_users
     
-    def update_task_status(self, user_id, date_index, status):
-        """Обновить статус задания"""
-        progress_ws = self.get_worksheet('progress')
-        all_progress = progress_ws.get_all_values()
+    def update_task_status(self, user_id, date_index, status, only_if=None):
+        """Обновить статус задания (если задан only_if - только поверх этого статуса)"""
+        user_row = self.cache.find_row('progress', 'ID_Участника', user_id)
+        if not user_row:
+            return False
+        matrix = self.progress_matrix()
+        if only_if is not None:
+            slot = matrix.slot(user_id)
+            if slot is None or matrix.status(slot, date_index) != only_if:
+                return False
         
-        for i, row in enumerate(all_progress):
-            if i == 0:
-                continue
-            if row[0] == str(user_id):
-                # Находим колонку для даты (даты начинаются с 3 колонки)
-                status_col = 3 + date_index
-                progress_ws.update_cell(i + 1, status_col, status)
-                return True
-        return False
+        self.cache.update_cell('progress', user_row, matrix.status_column(date_index), status)
+        self._touch(user_id)
+        return True
+    
+    def update_task_statuses(self, user_ids, date_index, status, only_if=None):
+        """Обновить статус задания для списка пользователей одним запросом"""
+        # Номера строк и текущие статусы берем из свежего листа: за время жизни кэша
+        # лист могли отсортировать, и статусы попали бы в чужие строки
+        self.cache.invalidate('progress')
+        matrix = self.progress_matrix()
+        if only_if is not None:
+            user_ids = [
+                user_id for user_id in user_ids
+                if matrix.slot(user_id) is not None and matrix.status(matrix.slot(user_id), date_index) == only_if
+            ]
+        col = matrix.status_column(date_index)
+        updated = 0
+        with self.batch('progress') as batch:
+            for user_id in user_ids:
+                user_row = self.cache.find_row('progress', 'ID_Участника', user_id)
+                if user_row:
+                    batch.set(user_row, col, status)
+                    updated += 1
+        for user_id in user_ids:
+            self._touch(user_id)
+        return updated
     
     def get_config(self):
         """Получить конфигурацию"""
-        config_ws = self.get_worksheet('config')
-        config = config_ws.get_all_records()
+        config = self.cache.records('config')
         if config:
             return config[0]
         return None
+    
+    def mark_overdue(self, date_index, dry_run=False):
+        """Отметить просроченными активные задания дня"""
+        col = self.progress_matrix().status_column(date_index)
+        letter = rowcol_to_a1(1, col)[:-1]
+        
+        # Одно чтение: только колонка статусов этого дня
+        column = self.cache.read_range('progress', f"{letter}2:{letter}")
+        statuses = [cells[0] if cells else '' for cells in column]
+        overdue = [i for i, status in enumerate(statuses) if status == '⏳']
+        
+        if dry_run:
+            # Проверка без записи читает то же, что и настоящая: отчет совпадет с ней
+            sample = ', '.join(str(i + 2) for i in overdue[:5])
+            more = ', …' if len(overdue) > 5 else ''
+            logger.info(f"Проверка без записи: {len(overdue)} заданий станут просроченными"
+                        + (f" (строки {sample}{more})" if overdue else ""))
+            return len(overdue)
+        
+        if overdue:
+            # Одна запись: диапазон от первой до последней измененной строки.
+            # После дедлайна статусы дня никто не меняет, так что колонку можно переписать целиком
+            first, last = overdue[0], overdue[-1]
+            values = [['✖️' if status == '⏳' else status] for status in statuses[first:last + 1]]
+            self.cache.batch_update('progress', [{
+                'range': f"{letter}{first + 2}:{letter}{last + 2}",
+                'values': values
+            }])
+        
+        # Сверяем рейтинг с таблицей (её могли поправить вручную)
+        self.refresh_leaderboard()
+        self._touch()
+        return len(overdue)
@@ -0,0 +1,55 @@
+"""Массовая регистрация участников до старта календаря.
+
+Запуск:
+    python import_participants.py participants.csv   # ФИО из первой колонки CSV
+    python import_participants.py                    # участники с листа «Участники»
+    python import_participants.py --campaign KEY ... # в календарь из CAMPAIGNS_FILE
+"""
+import argparse
+import csv
+
+from campaigns import load_campaigns
+from storage import create_storage
+
+
+def read_names(path):
+    """ФИО из первой колонки CSV (строка заголовка «ФИО» пропускается)"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        names = [row[0].strip() for row in csv.reader(f) if row and row[0].strip()]
+    if names and names[0] == 'ФИО':
+        names = names[1:]
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Массовая регистрация участников")
+    parser.add_argument('path', nargs='?', help="CSV с ФИО в первой колонке")
+    parser.add_argument('--campaign', help="Ключ кампании (по умолчанию - первая)")
+    args = parser.parse_args()
+
+    campaigns = load_campaigns()
+    campaign = campaigns[0]
+    if args.campaign:
+        matches = [c for c in campaigns if c.key == args.campaign]
+        if not matches:
+            parser.error(f"Кампания {args.campaign} не найдена")
+        campaign = matches[0]
+
+    names = read_names(args.path) if args.path else None
+
+    storage = create_storage(campaign)
+    counts = storage.import_participants(names)
+
+    print(
+        f"Добавлено участников: {counts['users']}, "
+        f"расписаний: {counts['schedules']}, строк прогресса: {counts['progress']}"
+    )
+    # В таблицу изменения отправляет задача синхронизации бота: если запускать ее
+    # и здесь, оба процесса могут взять одни и те же строки очереди и задублировать их
+    pending = storage.pending_changes()
+    if pending:
+        print(f"Ожидают отправки в таблицу: {pending} изменений (их отправит запущенный бот)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    date TEXT PRIMARY KEY,
+    started TEXT NOT NULL,
+    finished TEXT,
+    advanced TEXT
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    date TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    sent TEXT,
+    PRIMARY KEY (date, chat_id)
+);
+"""
+
+
+class BroadcastJournal:
+    """Журнал рассылок: кому сообщение дня уже доставлено"""
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        # Журналы, созданные до появления колонки advanced
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(runs)")]
+        if 'advanced' not in columns:
+            self.db.execute("ALTER TABLE runs ADD COLUMN advanced TEXT")
+        self.lock = threading.Lock()
+
+    def start(self, date, chat_ids):
+        """Начать (или продолжить) рассылку даты и вернуть ещё не получивших"""
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.execute("INSERT OR IGNORE INTO runs (date, started) VALUES (?, ?)", (date, now))
+            self.db.executemany(
+                "INSERT OR IGNORE INTO deliveries (date, chat_id) VALUES (?, ?)",
+                ((date, chat_id) for chat_id in chat_ids)
+            )
+            self.db.execute("COMMIT")
+            finished = self.db.execute("SELECT finished FROM runs WHERE date = ?", (date,)).fetchone()[0]
+            if finished:
+                return set()
+            return {
+                chat_id for (chat_id,) in self.db.execute(
+                    "SELECT chat_id FROM deliveries WHERE date = ? AND sent IS NULL", (date,)
+                )
+            }
+
+    def mark_sent(self, date, chat_id):
+        """Отметить доставку одному участнику"""
+        with self.lock:
+            self.db.execute(
+                "UPDATE deliveries SET sent = ? WHERE date = ? AND chat_id = ?",
+                (datetime.now().isoformat(), date, chat_id)
+            )
+
+    def finish(self, date):
+        """Рассылка даты завершена"""
+        with self.lock:
+            self.db.execute(
+                "UPDATE runs SET finished = ? WHERE date = ?", (datetime.now().isoformat(), date)
+            )
+
+    def advance(self, date):
+        """После рассылки следующая дата в календаре обновлена"""
+        with self.lock:
+            self.db.execute(
+                "UPDATE runs SET advanced = ? WHERE date = ?", (datetime.now().isoformat(), date)
+            )
+
+    def is_unfinished(self, date):
+        """Рассылка даты начата, но не завершена"""
+        with self.lock:
+            row = self.db.execute("SELECT finished FROM runs WHERE date = ?", (date,)).fetchone()
+            return row is not None and row[0] is None
+
+    def unfinished(self):
+        """Даты начатых, но не завершенных рассылок"""
+        with self.lock:
+            return [date for (date,) in self.db.execute("SELECT date FROM runs WHERE finished IS NULL")]
+
+    def unadvanced(self):
+        """Даты завершенных рассылок, после которых не обновлена следующая дата"""
+        with self.lock:
+            return [date for (date,) in self.db.execute(
+                "SELECT date FROM runs WHERE finished IS NOT NULL AND advanced IS NULL"
+            )]
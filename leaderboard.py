@@ -0,0 +1,61 @@
+import bisect
+import itertools
+import threading
+
+
+class Leaderboard:
+    """Рейтинг участников по числу выполненных заданий, обновляемый точечно"""
+    def __init__(self):
+        # Отсортированный список ключей (-выполнено, порядок, user_id)
+        self.entries = []
+        # user_id -> (ключ в entries, ФИО)
+        self.users = {}
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+
+    def load_counts(self, counts):
+        """Построить рейтинг по тройкам (ID, ФИО, выполнено)"""
+        with self.lock:
+            self.entries = []
+            self.users = {}
+            for user_id, name, done in counts:
+                user_id = str(user_id)
+                if not user_id or user_id in self.users:
+                    continue
+                key = (-done, next(self.order), user_id)
+                self.entries.append(key)
+                self.users[user_id] = (key, name)
+            self.entries.sort()
+
+    def set(self, user_id, name, done):
+        """Обновить число выполненных заданий участника"""
+        user_id = str(user_id)
+        with self.lock:
+            old = self.users.get(user_id)
+            if old is not None:
+                key = old[0]
+                self.entries.pop(bisect.bisect_left(self.entries, key))
+                key = (-done, key[1], user_id)
+            else:
+                key = (-done, next(self.order), user_id)
+            bisect.insort(self.entries, key)
+            self.users[user_id] = (key, name)
+
+    def top(self, limit):
+        """Первые limit участников, выполнивших хотя бы одно задание"""
+        with self.lock:
+            result = []
+            for done, _, user_id in self.entries[:limit]:
+                if done == 0:
+                    break
+                result.append((self.users[user_id][1], -done))
+            return result
+
+    def rank(self, user_id):
+        """Место участника и число выполненных заданий"""
+        with self.lock:
+            entry = self.users.get(str(user_id))
+            if entry is None:
+                return None
+            key = entry[0]
+            return bisect.bisect_left(self.entries, key) + 1, -key[0]
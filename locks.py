@@ -0,0 +1,26 @@
+import threading
+from contextlib import contextmanager
+
+
+class KeyedLocks:
+    """Набор блокировок по ключу (например, по пользователю)"""
+    def __init__(self):
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        """Захватить блокировку ключа; неиспользуемые блокировки удаляются"""
+        with self.lock:
+            entry = self.locks.get(key)
+            if entry is None:
+                entry = self.locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.locks[key]
@@ -0,0 +1,220 @@
+import contextvars
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Команда или задача, от имени которой идут запросы к Sheets API
+current_command = contextvars.ContextVar('metrics_command', default='other')
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format(name, labels, suffix=''):
+    if not labels:
+        return name + suffix
+    pairs = ','.join(f'{k}="{v}"' for k, v in labels)
+    return f'{name}{suffix}{{{pairs}}}'
+
+
+class Histogram:
+    """Гистограмма значений с фиксированными корзинами"""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Реестр метрик: счетчики, значения и гистограммы с метками"""
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def value(self, name, **labels):
+        """Текущее значение счетчика или показателя"""
+        key = _key(name, labels)
+        with self.lock:
+            return self.gauges.get(key, self.counters.get(key, 0))
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        with self.lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                typed = set()
+                for (name, labels), value in sorted(values.items()):
+                    if name not in typed:
+                        lines.append(f'# TYPE {name} {kind}')
+                        typed.add(name)
+                    lines.append(f'{_format(name, labels)} {value}')
+            typed = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} histogram')
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    bucket_labels = labels + (('le', bound),)
+                    lines.append(f'{_format(name, bucket_labels, "_bucket")} {cumulative}')
+                lines.append(f'{_format(name, labels + (("le", "+Inf"),), "_bucket")} {histogram.count}')
+                lines.append(f'{_format(name, labels, "_sum")} {histogram.sum:.6f}')
+                lines.append(f'{_format(name, labels, "_count")} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, name):
+        """Сводка гистограммы по меткам: {метки: (вызовов, среднее, p95)}"""
+        with self.lock:
+            return {
+                labels: (h.count, h.sum / h.count if h.count else 0.0, h.quantile(0.95))
+                for (metric, labels), h in sorted(self.histograms.items())
+                if metric == name
+            }
+
+    def totals(self, name, label):
+        """Сумма счетчика в разрезе одной метки"""
+        result = {}
+        with self.lock:
+            for (metric, labels), value in self.counters.items():
+                if metric == name:
+                    key = dict(labels).get(label, '')
+                    result[key] = result.get(key, 0) + value
+        return result
+
+
+metrics = Metrics()
+
+
+def timed_handler(func):
+    """Декоратор обработчика Telegram: время, вызовы, ошибки и команда для запросов"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_command.set(name)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            metrics.inc('bot_handler_errors_total', handler=name)
+            raise
+        finally:
+            metrics.observe('bot_handler_seconds', time.perf_counter() - started, handler=name)
+            current_command.reset(token)
+    return wrapper
+
+
+def timed_job(func):
+    """Декоратор задачи планировщика: длительность и ошибки"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_command.set(name)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            metrics.inc('bot_job_errors_total', job=name)
+            raise
+        finally:
+            metrics.observe('bot_job_seconds', time.perf_counter() - started, job=name)
+            current_command.reset(token)
+    return wrapper
+
+
+def _timed_method(backend, name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            metrics.observe(
+                'storage_call_seconds', time.perf_counter() - started,
+                backend=backend, method=name
+            )
+    return wrapper
+
+
+def instrument(cls):
+    """Декоратор класса хранилища: замер времени всех публичных методов"""
+    backend = cls.__name__
+    for name, attr in list(vars(cls).items()):
+        if not name.startswith('_') and callable(attr):
+            setattr(cls, name, _timed_method(backend, name, attr))
+    return cls
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1'):
+    """Запустить HTTP-сервер /metrics в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
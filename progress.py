@@ -0,0 +1,319 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+from gspread.utils import numericise
+
+# Коды статусов в матрице прогресса: индекс в STATUSES
+STATUSES = ('➖', '⏳', '✅', '✖️')
+CODES = {status: code for code, status in enumerate(STATUSES)}
+
+# Колонки листа прогресса до статусов: ID_Участника, ФИО, День
+FIXED_COLUMNS = 3
+STATUS_PREFIX = 'Статус_'
+DONE_COLUMN = 'Всего_выполнено'
+
+# Снимок: сигнатура, длина JSON с участниками, затем массивы статусов и счетчиков
+MAGIC = b'ADVPROG1'
+PREFIX = struct.Struct('<8sI')
+
+
+def _align(offset, size=8):
+    return (offset + size - 1) // size * size
+
+
+class Participant:
+    """Участник в матрице прогресса"""
+    __slots__ = ('user_id', 'name', 'day')
+
+    def __init__(self, user_id, name, day):
+        self.user_id = user_id
+        self.name = name
+        self.day = day
+
+
+class ProgressMatrix:
+    """Прогресс всех участников: статусы по дням в одном массиве кодов.
+
+    Участник занимает слот: строка статусов в statuses (days байт подряд)
+    и счетчик выполненных в done
+    """
+    def __init__(self, days, header=None, sheet_id=numericise):
+        self.days = days
+        self.header = list(header) if header else (
+            ['ID_Участника', 'ФИО', 'День']
+            + [f"{STATUS_PREFIX}{i + 1}" for i in range(days)]
+            + [DONE_COLUMN]
+        )
+        # Колонки статусов и счетчика ищем по заголовкам: после них могут быть
+        # и другие колонки (например, заметки организаторов)
+        status_cols = [i for i, name in enumerate(self.header) if str(name).startswith(STATUS_PREFIX)]
+        if len(status_cols) != days:
+            status_cols = list(range(FIXED_COLUMNS, FIXED_COLUMNS + days))
+        self.status_cols = status_cols
+        self.status_days = {col: day for day, col in enumerate(status_cols)}
+        self.done_col = (self.header.index(DONE_COLUMN) if DONE_COLUMN in self.header
+                         else FIXED_COLUMNS + days)
+        # Как ID хранится в таблице ('' - участник без Telegram ID)
+        self.sheet_id = sheet_id
+        self.participants = []
+        self.slots = {}
+        self.statuses = array('B')
+        self.done = array('I')
+        # Растет при каждом изменении: по нему решаем, пора ли сохранять снимок
+        self.version = 0
+        self.lock = threading.RLock()
+        self.snapshot = None
+
+    @classmethod
+    def from_values(cls, values, days=None, sheet_id=numericise):
+        """Матрица по значениям листа прогресса (заголовок и строки)"""
+        header = values[0] if values else []
+        if days is None:
+            days = sum(1 for name in header if str(name).startswith(STATUS_PREFIX))
+        matrix = cls(days, header or None, sheet_id)
+        for row in values[1:]:
+            matrix.append_values(row)
+        return matrix
+
+    def __len__(self):
+        return len(self.participants)
+
+    # Изменения
+
+    def _writable(self):
+        """Перейти со снимка (только чтение с диска) на собственные массивы"""
+        if self.snapshot is not None:
+            self.statuses = array('B', self.statuses.tobytes())
+            done = array('I')
+            done.frombytes(self.done.tobytes())
+            self.done = done
+            self.snapshot = None
+
+    def _index(self, slot, user_id):
+        # Как и индекс кэша листа: ключ ведет на первую строку с этим ID
+        if user_id and (user_id not in self.slots or self.slots[user_id] > slot):
+            self.slots[user_id] = slot
+
+    def append(self, user_id, name, day=0, statuses=None, done=0):
+        """Добавить участника и вернуть его слот"""
+        with self.lock:
+            self._writable()
+            slot = len(self.participants)
+            user_id = str(user_id)
+            self.participants.append(Participant(user_id, name, day))
+            codes = [CODES.get(status, 0) for status in (statuses or [])[:self.days]]
+            codes += [0] * (self.days - len(codes))
+            self.statuses.extend(codes)
+            self.done.append(max(0, int(done or 0)))
+            self._index(slot, user_id)
+            self.version += 1
+            return slot
+
+    def put(self, user_id, name, day=0, statuses=None, done=0):
+        """Добавить участника или сбросить прогресс существующего"""
+        with self.lock:
+            slot = self.slot(user_id)
+            if slot is None:
+                return self.append(user_id, name, day, statuses, done)
+            participant = self.participants[slot]
+            participant.name = name
+            participant.day = day
+            for day_index in range(self.days):
+                self.set_status(slot, day_index, statuses[day_index] if statuses else '➖')
+            self.set_done(slot, done)
+            return slot
+
+    def rename(self, old_id, user_id):
+        """Перенести прогресс участника на новый ID"""
+        with self.lock:
+            slot = self.slots.pop(str(old_id), None)
+            if slot is None:
+                return False
+            self.participants[slot].user_id = str(user_id)
+            self._index(slot, str(user_id))
+            self.version += 1
+            return True
+
+    def set_status(self, slot, day, status):
+        if slot is None:
+            return
+        with self.lock:
+            self._writable()
+            self.statuses[slot * self.days + day] = CODES.get(status, 0)
+            self.version += 1
+
+    def set_done(self, slot, done):
+        if slot is None:
+            return
+        with self.lock:
+            self._writable()
+            self.done[slot] = max(0, int(done or 0))
+            self.version += 1
+
+    # Раскладка листа прогресса: колонки с 1, слот = строка листа - 2
+
+    def append_values(self, row):
+        """Добавить участника по строке листа прогресса"""
+        row = [str(value) for value in row]
+        row += [''] * (max(len(self.header), self.done_col + 1) - len(row))
+        done = row[self.done_col]
+        return self.append(
+            row[0], row[1], numericise(row[2]),
+            [row[col] for col in self.status_cols],
+            int(done) if done.isdigit() else 0
+        )
+
+    def set_value(self, slot, col, value):
+        """Записать ячейку листа прогресса в матрицу"""
+        with self.lock:
+            while len(self.participants) <= slot:
+                self.append('', '')
+            participant = self.participants[slot]
+            value = str(value)
+            if col == 1:
+                if self.slots.get(participant.user_id) == slot:
+                    del self.slots[participant.user_id]
+                participant.user_id = value
+                self._index(slot, value)
+                self.version += 1
+            elif col == 2:
+                participant.name = value
+                self.version += 1
+            elif col == 3:
+                participant.day = numericise(value)
+                self.version += 1
+            elif col - 1 in self.status_days:
+                self.set_status(slot, self.status_days[col - 1], value)
+            elif col - 1 == self.done_col:
+                self.set_done(slot, int(value) if value.isdigit() else 0)
+
+    # Чтение
+
+    def slot(self, user_id):
+        """Слот участника по ID или None"""
+        return self.slots.get(str(user_id))
+
+    def blank_row(self, user_id, name):
+        """Строка листа для нового участника в раскладке заголовка"""
+        values = [''] * max(len(self.header), self.done_col + 1)
+        values[:FIXED_COLUMNS] = [user_id, name, 0]
+        for col in self.status_cols:
+            values[col] = '➖'
+        values[self.done_col] = 0
+        return values
+
+    def status_column(self, day):
+        """Колонка листа (с 1) со статусом дня"""
+        return self.status_cols[day] + 1
+
+    def done_column(self):
+        """Колонка листа (с 1) со счетчиком выполненных"""
+        return self.done_col + 1
+
+    def status(self, slot, day):
+        return STATUSES[self.statuses[slot * self.days + day]]
+
+    def record(self, slot):
+        """Прогресс участника в виде записи листа"""
+        with self.lock:
+            participant = self.participants[slot]
+            start = slot * self.days
+            values = [''] * max(len(self.header), self.done_col + 1)
+            values[:FIXED_COLUMNS] = [self.sheet_id(participant.user_id), participant.name, participant.day]
+            for col, code in zip(self.status_cols, self.statuses[start:start + self.days]):
+                values[col] = STATUSES[code]
+            values[self.done_col] = self.done[slot]
+            return dict(zip(self.header, values))
+
+    def counts(self):
+        """Пары для рейтинга: (ID, ФИО, выполнено) участников с Telegram ID"""
+        with self.lock:
+            return [
+                (participant.user_id, participant.name, self.done[slot])
+                for slot, participant in enumerate(self.participants)
+                if self.sheet_id(participant.user_id) != ''
+            ]
+
+    def slots_with(self, day, status):
+        """Слоты участников, у которых в день day стоит status"""
+        code = CODES[status]
+        with self.lock:
+            days = self.days
+            statuses = self.statuses
+            return [
+                slot for slot in range(len(self.participants))
+                if statuses[slot * days + day] == code
+            ]
+
+    def count(self, day, status):
+        return len(self.slots_with(day, status))
+
+    # Снимок на диске
+
+    def save(self, path, stamp=None):
+        """Сохранить матрицу в двоичный файл (атомарно через временный файл)"""
+        with self.lock:
+            meta = json.dumps({
+                'stamp': stamp,
+                'days': self.days,
+                'header': self.header,
+                'byteorder': sys.byteorder,
+                'participants': [[p.user_id, p.name, p.day] for p in self.participants],
+            }, ensure_ascii=False).encode('utf-8')
+            statuses = self.statuses.tobytes()
+            done = self.done.tobytes()
+            version = self.version
+
+        statuses_offset = _align(PREFIX.size + len(meta))
+        done_offset = _align(statuses_offset + len(statuses))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(PREFIX.pack(MAGIC, len(meta)))
+            f.write(meta)
+            f.write(b'\0' * (statuses_offset - PREFIX.size - len(meta)))
+            f.write(statuses)
+            f.write(b'\0' * (done_offset - statuses_offset - len(statuses)))
+            f.write(done)
+        os.replace(tmp_path, path)
+        return version
+
+    @classmethod
+    def load(cls, path, sheet_id=numericise):
+        """Открыть снимок через mmap: (матрица, метка) или None, если файла нет или он чужой"""
+        try:
+            with open(path, 'rb') as f:
+                snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        magic, meta_size = PREFIX.unpack_from(snapshot) if len(snapshot) >= PREFIX.size else (None, 0)
+        if magic != MAGIC:
+            snapshot.close()
+            return None
+        meta = json.loads(bytes(snapshot[PREFIX.size:PREFIX.size + meta_size]).decode('utf-8'))
+        if meta['byteorder'] != sys.byteorder:
+            snapshot.close()
+            return None
+
+        matrix = cls(meta['days'], meta['header'], sheet_id)
+        count = len(meta['participants'])
+        statuses_offset = _align(PREFIX.size + meta_size)
+        done_offset = _align(statuses_offset + count * matrix.days)
+        if len(snapshot) < done_offset + count * matrix.done.itemsize:
+            snapshot.close()
+            return None
+
+        # Массивы читаем прямо из отображенного файла; копия появится при первом изменении
+        view = memoryview(snapshot)
+        matrix.snapshot = snapshot
+        matrix.statuses = view[statuses_offset:statuses_offset + count * matrix.days]
+        matrix.done = view[done_offset:done_offset + count * matrix.done.itemsize].cast('I')
+        for slot, (user_id, name, day) in enumerate(meta['participants']):
+            matrix.participants.append(Participant(user_id, name, day))
+            matrix._index(slot, user_id)
+        return matrix, meta['stamp']
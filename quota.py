@@ -0,0 +1,136 @@
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from gspread.exceptions import APIError
+from requests.exceptions import ConnectionError, Timeout
+
+from config import (
+    SHEETS_QUOTA_PER_MINUTE, SHEETS_QUOTA_BURST, SHEETS_MAX_RETRIES,
+    SHEETS_BACKOFF_BASE, SHEETS_BACKOFF_MAX
+)
+from metrics import current_command, metrics
+
+logger = logging.getLogger(__name__)
+
+# Очереди запросов: команды пользователей идут раньше массовых задач
+INTERACTIVE = 0
+BULK = 1
+
+current_lane = contextvars.ContextVar('sheets_lane', default=INTERACTIVE)
+
+# Коды ответов, после которых запрос стоит повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@contextmanager
+def bulk_lane():
+    """Выполнять запросы внутри блока в очереди массовых задач"""
+    token = current_lane.set(BULK)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+def bulk_job(func):
+    """Декоратор: все запросы асинхронной задачи идут в очередь массовых задач"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with bulk_lane():
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+class RequestScheduler:
+    """Планировщик запросов к Sheets API: токен-бакет, приоритеты и повторы"""
+    def __init__(self, per_minute=SHEETS_QUOTA_PER_MINUTE, burst=SHEETS_QUOTA_BURST,
+                 max_retries=SHEETS_MAX_RETRIES, backoff_base=SHEETS_BACKOFF_BASE,
+                 backoff_max=SHEETS_BACKOFF_MAX):
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.waiting = {INTERACTIVE: 0, BULK: 0}
+        self.cond = threading.Condition()
+        self.counters = {
+            'calls': 0,
+            'throttled': 0,
+            'rate_limited': 0,
+            'retried': 0,
+            'failed': 0
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, lane=INTERACTIVE):
+        """Дождаться токена; массовые задачи пропускают вперед команды пользователей"""
+        with self.cond:
+            self.waiting[lane] += 1
+            throttled = False
+            try:
+                while True:
+                    self._refill()
+                    if self.tokens >= 1 and (lane == INTERACTIVE or not self.waiting[INTERACTIVE]):
+                        self.tokens -= 1
+                        break
+                    throttled = True
+                    delay = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.05
+                    self.cond.wait(delay)
+            finally:
+                self.waiting[lane] -= 1
+                self.cond.notify_all()
+            self.counters['calls'] += 1
+            if throttled:
+                self.counters['throttled'] += 1
+
+    def _count(self, name):
+        with self.cond:
+            self.counters[name] += 1
+
+    def call(self, func, *args, idempotent=True, **kwargs):
+        """Выполнить запрос с учетом квоты и повторить при 429/5xx.
+
+        Неидемпотентные запросы (добавление строк) повторяем только после 429:
+        после 5xx или таймаута строка могла уже записаться
+        """
+        lane = current_lane.get()
+        for attempt in range(self.max_retries + 1):
+            self.acquire(lane)
+            metrics.inc('sheets_requests_total', command=current_command.get())
+            try:
+                return func(*args, **kwargs)
+            except APIError as e:
+                status = e.response.status_code
+                retry = status in RETRY_STATUSES if idempotent else status == 429
+                if not retry or attempt == self.max_retries:
+                    self._count('failed')
+                    raise
+                if status == 429:
+                    self._count('rate_limited')
+                error = e
+            except (ConnectionError, Timeout) as e:
+                if not idempotent or attempt == self.max_retries:
+                    self._count('failed')
+                    raise
+                error = e
+
+            # Экспоненциальная задержка со случайным разбросом
+            self._count('retried')
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            logger.warning(f"Запрос к Sheets API не удался ({error}), повтор через {delay:.1f} с")
+            time.sleep(delay)
+
+    def stats(self):
+        with self.cond:
+            return dict(self.counters)
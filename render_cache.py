@@ -0,0 +1,37 @@
+import threading
+
+
+class RenderCache:
+    """Кэш готовых сообщений: по одному на пользователя, с ключом версии данных"""
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, user_id, key):
+        """Сообщение, если оно построено для того же ключа, иначе None"""
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, key, message):
+        with self.lock:
+            self.entries[user_id] = (key, message)
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hit_ratio, 3),
+            'size': len(self.entries)
+        }
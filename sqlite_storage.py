@@ -0,0 +1,716 @@
+import json
+import logging
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from gspread.utils import numericise
+
+from cache import INDEX_COLUMNS
+from config import SHEETS_SYNC_BATCH
+from metrics import instrument
+from progress import ProgressMatrix
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id TEXT NOT NULL DEFAULT '',
+    full_name TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT '',
+    registered TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS users_telegram_id ON users(telegram_id);
+CREATE INDEX IF NOT EXISTS users_full_name ON users(full_name);
+
+CREATE TABLE IF NOT EXISTS schedules (
+    user_id TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    task_id TEXT NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS progress (
+    user_id TEXT PRIMARY KEY,
+    full_name TEXT NOT NULL,
+    extra TEXT NOT NULL DEFAULT '0',
+    done INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS statuses (
+    user_id TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
+CREATE INDEX IF NOT EXISTS progress_full_name ON progress(full_name);
+CREATE INDEX IF NOT EXISTS statuses_day ON statuses(day, status);
+
+CREATE TABLE IF NOT EXISTS config (
+    position INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL DEFAULT ''
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sheet TEXT NOT NULL,
+    op TEXT NOT NULL,
+    key_column TEXT,
+    key TEXT,
+    row INTEGER,
+    col INTEGER,
+    value TEXT NOT NULL
+);
+"""
+
+CONFIG_KEYS = ['Следующая_дата', 'Текущий_индекс', 'Дата_последней_рассылки']
+
+# Снимок матрицы прогресса лежит рядом с базой
+SNAPSHOT_SUFFIX = '.progress'
+
+
+# Временный ключ заранее созданного участника, пока нет Telegram ID
+PENDING_PREFIX = 'ФИО:'
+
+
+def pending_id(full_name):
+    return PENDING_PREFIX + full_name
+
+
+def sheet_id(user_id):
+    """ID участника в том виде, как он записан в таблице"""
+    return '' if user_id.startswith(PENDING_PREFIX) else numericise(user_id)
+
+
+def date_key(prefix, date):
+    return f"{prefix}_{date.replace('.', '_')}"
+
+
+@instrument
+class SQLiteStorage(Storage):
+    """Хранилище в локальной SQLite с зеркалированием в Google Таблицу"""
+    def __init__(self, path, gsheets):
+        super().__init__()
+        self.gsheets = gsheets
+        self.campaign = gsheets.campaign
+        self.tasks = gsheets.tasks
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+        if self._meta('seeded') is None:
+            self.seed_from_sheets()
+
+        # Прогресс всех участников в памяти: при перезапуске берем снимок с диска
+        self.snapshot_path = None if path == ':memory:' else path + SNAPSHOT_SUFFIX
+        self.snapshot_version = 0
+        self.progress = self._load_progress()
+
+    # Служебные методы
+
+    @contextmanager
+    def transaction(self):
+        """Транзакция SQLite под блокировкой хранилища"""
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                yield self.db
+            except Exception:
+                self.db.execute("ROLLBACK")
+                # Матрица могла измениться внутри транзакции - перечитываем из базы
+                self.progress = self._build_progress()
+                raise
+            self.db.execute("COMMIT")
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (key, json.dumps(value, ensure_ascii=False))
+        )
+
+    def _enqueue_update(self, sheet, col, value, key_column=None, key=None, row=None):
+        """Поставить изменение ячейки в очередь на зеркалирование"""
+        self.db.execute(
+            "INSERT INTO outbox (sheet, op, key_column, key, row, col, value) "
+            "VALUES (?, 'update', ?, ?, ?, ?, ?)",
+            (sheet, key_column, None if key is None else str(key), row, col,
+             json.dumps(value, ensure_ascii=False))
+        )
+
+    def _enqueue_append(self, sheet, values):
+        """Поставить добавление строки в очередь на зеркалирование"""
+        self.db.execute(
+            "INSERT INTO outbox (sheet, op, value) VALUES (?, 'append', ?)",
+            (sheet, json.dumps(values, ensure_ascii=False))
+        )
+
+    def _progress_header(self):
+        header = self._meta('progress_header')
+        if header:
+            return header
+        return (['ID_Участника', 'ФИО', 'День']
+                + [date_key('Статус', date) for date in self.campaign.dates]
+                + ['Всего_выполнено'])
+
+    def _progress_stamp(self):
+        """Метка состояния базы для проверки снимка.
+
+        Любое изменение прогресса ставит запись в outbox, а её AUTOINCREMENT
+        не уменьшается и после отправки в таблицу
+        """
+        row = self.db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'outbox'").fetchone()
+        return [self._meta('seeded'), row[0] if row else 0]
+
+    def _build_progress(self):
+        """Матрица прогресса по данным базы"""
+        matrix = ProgressMatrix(self.campaign.days, self._progress_header(), sheet_id)
+        statuses = self._statuses()
+        for user_id, full_name, extra, done in self.db.execute(
+            "SELECT user_id, full_name, extra, done FROM progress ORDER BY rowid"
+        ).fetchall():
+            matrix.append(user_id, full_name, numericise(extra), statuses.get(user_id), done)
+        return matrix
+
+    def _load_progress(self):
+        """Матрица из снимка, если он соответствует базе, иначе из базы"""
+        with self.lock:
+            stamp = self._progress_stamp()
+            if self.snapshot_path is not None:
+                loaded = ProgressMatrix.load(self.snapshot_path, sheet_id)
+                if loaded is not None and loaded[1] == stamp:
+                    logger.info(f"Прогресс загружен из снимка {self.snapshot_path}: {len(loaded[0])} участников")
+                    return loaded[0]
+            matrix = self._build_progress()
+            if self.snapshot_path is not None:
+                self.snapshot_version = matrix.save(self.snapshot_path, stamp)
+            return matrix
+
+    def _slot(self, user_id):
+        """Слот участника в матрице; если его там нет, дочитываем участника из базы.
+
+        Базу могут изменить и другие процессы (например, import_participants.py)
+        """
+        slot = self.progress.slot(user_id)
+        if slot is not None:
+            return slot
+        with self.lock:
+            row = self.db.execute(
+                "SELECT full_name, extra, done FROM progress WHERE user_id = ?", (str(user_id),)
+            ).fetchone()
+            if not row:
+                return None
+            full_name, extra, done = row
+            statuses = self._statuses(user_id).get(str(user_id))
+            return self.progress.put(str(user_id), full_name, numericise(extra), statuses, done)
+
+    def _save_progress(self):
+        """Сохранить снимок матрицы, если она изменилась"""
+        if self.snapshot_path is None:
+            return
+        with self.lock:
+            if self.progress.version != self.snapshot_version:
+                self.snapshot_version = self.progress.save(self.snapshot_path, self._progress_stamp())
+
+    def seed_from_sheets(self):
+        """Первичная загрузка данных из Google Таблицы"""
+        cache = self.gsheets.cache
+        with self.transaction():
+            for user in cache.records('users'):
+                self.db.execute(
+                    "INSERT INTO users (telegram_id, full_name, status, registered) "
+                    "VALUES (?, ?, ?, ?)",
+                    (str(user.get('ID_Telegram', '')), str(user.get('ФИО', '')),
+                     str(user.get('Статус', '')), str(user.get('Дата_регистрации', '')))
+                )
+
+            for schedule in cache.records('schedules'):
+                name = str(schedule.get('ФИО', ''))
+                user_id = str(schedule.get('ID_Участника', '')) or (pending_id(name) if name else '')
+                for day, date in enumerate(self.campaign.dates):
+                    task_id = schedule.get(date_key('Дата', date), '')
+                    if user_id and task_id != '':
+                        self.db.execute(
+                            "INSERT OR REPLACE INTO schedules (user_id, day, task_id) "
+                            "VALUES (?, ?, ?)",
+                            (user_id, day, str(task_id))
+                        )
+
+            values = cache.values('progress')
+            if values:
+                self._set_meta('progress_header', values[0])
+            # Колонки статусов и счетчика - по заголовку листа, как и в матрице прогресса
+            layout = ProgressMatrix(self.campaign.days, self._progress_header())
+            width = max(layout.status_cols + [layout.done_col]) + 1
+            for row in values[1:]:
+                row = row + [''] * (width - len(row))
+                if not row[0] and not row[1]:
+                    continue
+                row[0] = row[0] or pending_id(row[1])
+                done = str(row[layout.done_col])
+                self.db.execute(
+                    "INSERT OR REPLACE INTO progress (user_id, full_name, extra, done) "
+                    "VALUES (?, ?, ?, ?)",
+                    (row[0], row[1], row[2], int(done) if done.isdigit() else 0)
+                )
+                for day, col in enumerate(layout.status_cols):
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO statuses (user_id, day, status) "
+                        "VALUES (?, ?, ?)",
+                        (row[0], day, row[col] or '➖')
+                    )
+
+            config = cache.records('config')
+            if config:
+                for position, (key, value) in enumerate(config[0].items()):
+                    self.db.execute(
+                        "INSERT INTO config (position, key, value) VALUES (?, ?, ?)",
+                        (position, key, str(value))
+                    )
+
+            self._set_meta('seeded', datetime.now().isoformat())
+
+    # Реализация интерфейса Storage
+
+    def reload_tasks(self):
+        """Перезагрузить каталог заданий из таблицы"""
+        count = self.gsheets.reload_tasks()
+        self._touch()
+        return count
+
+    def register_user(self, user_id, full_name):
+        """Регистрация нового пользователя"""
+        with self.transaction():
+            result = self._register_user(str(user_id), full_name)
+        self._touch(user_id)
+        return result
+
+    def _register_user(self, user_id, full_name):
+        # Проверяем, есть ли уже пользователь
+        row = self.db.execute(
+            "SELECT id, telegram_id FROM users WHERE full_name = ? ORDER BY id LIMIT 1", (full_name,)
+        ).fetchone()
+        if row:
+            return self._bind_user(row, user_id, full_name)
+
+        # Добавляем нового пользователя
+        registered = datetime.now().strftime('%d.%m.%Y')
+        self.db.execute(
+            "INSERT INTO users (telegram_id, full_name, status, registered) VALUES (?, ?, 'активен', ?)",
+            (user_id, full_name, registered)
+        )
+        self._enqueue_append('users', [user_id, full_name, 'активен', registered])
+
+        if not self._create_schedule(user_id, full_name):
+            return f"Ошибка: В базе меньше {self.campaign.days} заданий"
+
+        return self._welcome(full_name)
+
+    def _create_schedule(self, key, full_name, sheet_id=None):
+        """Создать расписание и прогресс участника, False если заданий мало"""
+        # Выбираем уникальные случайные задания на все дни
+        days = self.campaign.days
+        task_ids = self.tasks.ids()
+        if len(task_ids) < days:
+            return False
+        selected_tasks = random.sample(task_ids, days)
+        sheet_id = key if sheet_id is None else sheet_id
+
+        # Создаем расписание
+        self.db.executemany(
+            "INSERT OR REPLACE INTO schedules (user_id, day, task_id) VALUES (?, ?, ?)",
+            [(key, day, str(task_id)) for day, task_id in enumerate(selected_tasks)]
+        )
+        self._enqueue_append('schedules', [sheet_id, full_name] + selected_tasks)
+
+        # Создаем прогресс
+        self.db.execute(
+            "INSERT OR REPLACE INTO progress (user_id, full_name, extra, done) VALUES (?, ?, '0', 0)",
+            (key, full_name)
+        )
+        self.db.executemany(
+            "INSERT OR REPLACE INTO statuses (user_id, day, status) VALUES (?, ?, '➖')",
+            [(key, day) for day in range(days)]
+        )
+        self._enqueue_append('progress', self.progress.blank_row(sheet_id, full_name))
+        self.progress.put(key, full_name)
+        return True
+
+    def _bind_user(self, user, user_id, full_name):
+        """Привязать Telegram ID к существующему или заранее созданному участнику"""
+        row_id, old_id = user
+        self.db.execute(
+            "UPDATE users SET telegram_id = ?, status = 'активен' WHERE id = ?", (user_id, row_id)
+        )
+        self._enqueue_update('users', 1, user_id, key_column='ФИО', key=full_name)
+        self._enqueue_update('users', 3, 'активен', key_column='ФИО', key=full_name)
+
+        # Переносим расписание и прогресс со старого ID или с заготовки по ФИО
+        has_progress = self.db.execute(
+            "SELECT 1 FROM progress WHERE user_id = ?", (user_id,)
+        ).fetchone() is not None
+        for key in (old_id, pending_id(full_name)):
+            if has_progress or not key or key == user_id:
+                continue
+            if self.db.execute("SELECT 1 FROM progress WHERE user_id = ?", (key,)).fetchone():
+                for table in ('schedules', 'progress', 'statuses'):
+                    self.db.execute(f"UPDATE {table} SET user_id = ? WHERE user_id = ?", (user_id, key))
+                self.progress.rename(key, user_id)
+                self._enqueue_update('schedules', 1, user_id, key_column='ФИО', key=full_name)
+                self._enqueue_update('progress', 1, user_id, key_column='ФИО', key=full_name)
+                has_progress = True
+
+        if not has_progress and not self._create_schedule(user_id, full_name):
+            return f"Ошибка: В базе меньше {self.campaign.days} заданий"
+
+        if old_id:
+            return f"Добро пожаловать обратно, {full_name}!"
+        return self._welcome(full_name)
+
+    def import_participants(self, names=None):
+        """Массовая регистрация участников по списку ФИО"""
+        if len(self.tasks) < self.campaign.days:
+            raise ValueError(f"В базе меньше {self.campaign.days} заданий")
+
+        counts = {'users': 0, 'schedules': 0, 'progress': 0}
+        today = datetime.now().strftime('%d.%m.%Y')
+        with self.transaction():
+            # Без списка берем всех участников из базы
+            if names is None:
+                names = [row[0] for row in self.db.execute("SELECT full_name FROM users ORDER BY id")]
+
+            seen = set()
+            for name in names:
+                name = str(name).strip()
+                if not name or name in seen:
+                    continue
+                seen.add(name)
+
+                user = self.db.execute(
+                    "SELECT telegram_id FROM users WHERE full_name = ? ORDER BY id LIMIT 1", (name,)
+                ).fetchone()
+                if not user:
+                    self.db.execute(
+                        "INSERT INTO users (telegram_id, full_name, status, registered) "
+                        "VALUES ('', ?, 'ожидает', ?)",
+                        (name, today)
+                    )
+                    self._enqueue_append('users', ['', name, 'ожидает', today])
+                    counts['users'] += 1
+
+                # Заготовка расписания хранится под временным ключом до /start
+                if not self.db.execute("SELECT 1 FROM progress WHERE full_name = ?", (name,)).fetchone():
+                    telegram_id = user[0] if user else ''
+                    self._create_schedule(telegram_id or pending_id(name), name, sheet_id=telegram_id)
+                    counts['schedules'] += 1
+                    counts['progress'] += 1
+        return counts
+
+    def _statuses(self, user_id=None):
+        """Статусы заданий: user_id -> список статусов по дням"""
+        query = "SELECT user_id, day, status FROM statuses"
+        params = ()
+        if user_id is not None:
+            query += " WHERE user_id = ?"
+            params = (str(user_id),)
+        result = {}
+        for uid, day, status in self.db.execute(query, params):
+            statuses = result.setdefault(uid, ['➖'] * self.campaign.days)
+            if day < len(statuses):
+                statuses[day] = status
+        return result
+
+    def request_stats(self):
+        """Счетчики запросов к Sheets API (зеркалирование)"""
+        return self.gsheets.request_stats()
+
+    def sheet_cache_stats(self):
+        """Попадания и промахи кэша листов (зеркалирование)"""
+        return self.gsheets.sheet_cache_stats()
+
+    def has_user(self, user_id):
+        """Зарегистрирован ли пользователь с этим Telegram ID"""
+        return self._slot(user_id) is not None
+
+    def has_participant(self, full_name):
+        """Есть ли участник с таким ФИО в списке"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT 1 FROM users WHERE full_name = ?", (full_name,)
+            ).fetchone() is not None
+
+    def progress_matrix(self):
+        """Матрица прогресса, которая ведется вместе с базой"""
+        return self.progress
+
+    def get_user_progress(self, user_id):
+        """Получить прогресс пользователя"""
+        with self.lock:
+            slot = self._slot(user_id)
+            if slot is None:
+                return None
+            return self.progress.record(slot)
+
+    def _schedules(self, user_id=None):
+        query = (
+            "SELECT s.user_id, p.full_name, s.day, s.task_id FROM schedules s "
+            "LEFT JOIN progress p ON p.user_id = s.user_id"
+        )
+        params = ()
+        if user_id is not None:
+            query += " WHERE s.user_id = ?"
+            params = (str(user_id),)
+        result = {}
+        for uid, full_name, day, task_id in self.db.execute(query, params):
+            schedule = result.setdefault(uid, {'ID_Участника': sheet_id(uid), 'ФИО': full_name or ''})
+            if day < self.campaign.days:
+                schedule[date_key('Дата', self.campaign.dates[day])] = numericise(task_id)
+        return result
+
+    def get_user_schedule(self, user_id):
+        """Получить расписание пользователя"""
+        with self.lock:
+            return self._schedules(user_id).get(str(user_id))
+
+    def get_all_schedules(self):
+        """Получить расписания всех пользователей по ID_Участника"""
+        with self.lock:
+            return self._schedules()
+
+    def get_task_text(self, task_id):
+        """Получить текст задания по ID"""
+        return self.tasks.text(task_id)
+
+    def get_config(self):
+        """Получить конфигурацию"""
+        with self.lock:
+            rows = self.db.execute("SELECT key, value FROM config ORDER BY position").fetchall()
+        if not rows:
+            return None
+        return {key: numericise(value) for key, value in rows}
+
+    def _set_config(self, key, value):
+        position = self.db.execute("SELECT position FROM config WHERE key = ?", (key,)).fetchone()[0]
+        self.db.execute("UPDATE config SET value = ? WHERE key = ?", (str(value), key))
+        self._enqueue_update('config', position + 1, value, row=2)
+
+    def mark_task_done(self, user_id):
+        """Отметить задание как выполненное"""
+        config = self.get_config()
+        if not config:
+            return "Календарь еще не начался"
+
+        current_idx = config.get('Текущий_индекс', 0)
+        if current_idx == 0:
+            return "Календарь еще не начался"
+
+        day = current_idx - 1
+        with self.lock:
+            if self.campaign.before_deadline():
+                # Условное обновление: статус меняется, только если задание еще активно,
+                # поэтому повторная отметка не увеличит счетчик дважды
+                with self.transaction():
+                    changed = self.db.execute(
+                        "UPDATE statuses SET status = '✅' "
+                        "WHERE user_id = ? AND day = ? AND status = '⏳'",
+                        (str(user_id), day)
+                    ).rowcount
+                    if changed:
+                        full_name, done_count = self.db.execute(
+                            "UPDATE progress SET done = done + 1 WHERE user_id = ? "
+                            "RETURNING full_name, done",
+                            (str(user_id),)
+                        ).fetchone()
+                        self._enqueue_update('progress', self.progress.status_column(day), '✅',
+                                             key_column='ID_Участника', key=user_id)
+                        self._enqueue_update('progress', self.progress.done_column(), done_count,
+                                             key_column='ID_Участника', key=user_id)
+                        slot = self._slot(user_id)
+                        self.progress.set_status(slot, day, '✅')
+                        self.progress.set_done(slot, done_count)
+                if changed:
+                    self._update_leaderboard(user_id, full_name, done_count)
+                    self._touch(user_id)
+                    return "✅ Задание отмечено как выполненное!"
+
+            slot = self._slot(user_id)
+            if slot is None:
+                return "Пользователь не найден"
+            current_status = self.progress.status(slot, day)
+
+            if current_status == '⏳':
+                return "⏰ Время вышло! Задание уже нельзя отметить."
+            elif current_status == '✅':
+                return "✅ Это задание уже выполнено!"
+            else:
+                return "📭 Сейчас нет активного задания для отметки."
+
+    def update_next_date(self):
+        """Обновить следующую дату"""
+        with self.transaction():
+            config = self.get_config()
+
+            if not config:
+                # Инициализация
+                initial = [self.campaign.dates[0], 0, '']
+                self.db.executemany(
+                    "INSERT INTO config (position, key, value) VALUES (?, ?, ?)",
+                    [(i, key, str(value)) for i, (key, value) in enumerate(zip(CONFIG_KEYS, initial))]
+                )
+                self._enqueue_append('config', CONFIG_KEYS)
+                self._enqueue_append('config', initial)
+            else:
+                current_idx = config.get('Текущий_индекс', 0)
+                dates = self.campaign.dates
+
+                if current_idx < len(dates):
+                    # Обновляем индекс
+                    self._set_config('Текущий_индекс', current_idx + 1)
+
+                    if current_idx + 1 < len(dates):
+                        # Обновляем следующую дату
+                        self._set_config('Следующая_дата', dates[current_idx + 1])
+        self._touch()
+
+    def get_all_active_users(self):
+        """Получить всех активных пользователей"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT telegram_id, full_name FROM users "
+                "WHERE status = 'активен' AND telegram_id != '' ORDER BY id"
+            ).fetchall()
+        return [{'id': numericise(telegram_id), 'name': full_name} for telegram_id, full_name in rows]
+
+    def update_task_status(self, user_id, date_index, status, only_if=None):
+        """Обновить статус задания (если задан only_if - только поверх этого статуса)"""
+        return self.update_task_statuses([user_id], date_index, status, only_if) > 0
+
+    def update_task_statuses(self, user_ids, date_index, status, only_if=None):
+        """Обновить статус задания для списка пользователей одной транзакцией"""
+        query = "UPDATE statuses SET status = ? WHERE user_id = ? AND day = ?"
+        if only_if is not None:
+            query += " AND status = ?"
+        updated = 0
+        with self.transaction():
+            for user_id in user_ids:
+                params = (status, str(user_id), date_index)
+                cursor = self.db.execute(query, params if only_if is None else params + (only_if,))
+                if cursor.rowcount:
+                    updated += 1
+                    self._enqueue_update('progress', self.progress.status_column(date_index), status,
+                                         key_column='ID_Участника', key=user_id)
+                    # Участник только что обновлен в базе, так что _slot его найдет
+                    self.progress.set_status(self._slot(user_id), date_index, status)
+        for user_id in user_ids:
+            self._touch(user_id)
+        return updated
+
+    def mark_overdue(self, date_index, dry_run=False):
+        """Отметить просроченными активные задания дня"""
+        if dry_run:
+            return self.progress.count(date_index, '⏳')
+
+        with self.transaction():
+            user_ids = [row[0] for row in self.db.execute(
+                "UPDATE statuses SET status = '✖️' WHERE day = ? AND status = '⏳' RETURNING user_id",
+                (date_index,)
+            ).fetchall()]
+            for user_id in user_ids:
+                self._enqueue_update('progress', self.progress.status_column(date_index), '✖️',
+                                     key_column='ID_Участника', key=user_id)
+                self.progress.set_status(self._slot(user_id), date_index, '✖️')
+        self.refresh_leaderboard()
+        self._touch()
+        return len(user_ids)
+
+    # Зеркалирование в Google Таблицу
+
+    def _progress_column(self, col):
+        """Колонку из очереди (по заголовку в базе) перевести в колонку текущего листа:
+        организаторы могли вставить колонки после загрузки базы"""
+        header = self.progress.header
+        sheet_header = self.gsheets.cache.table('progress').header
+        if col <= len(header) and header[col - 1] in sheet_header:
+            return sheet_header.index(header[col - 1]) + 1
+        return col
+
+    def pending_changes(self):
+        """Сколько изменений еще ждут отправки в Google Таблицу"""
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def sync(self, limit=SHEETS_SYNC_BATCH):
+        """Отправить накопленные изменения в Google Таблицу пачками"""
+        self._save_progress()
+        with self.lock:
+            ops = self.db.execute(
+                "SELECT id, sheet, op, key_column, key, row, col, value FROM outbox "
+                "ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        if not ops:
+            return 0
+
+        cache = self.gsheets.cache
+
+        # Сначала добавляем строки, чтобы обновления могли найти их по ключу
+        appends = {}
+        for op_id, sheet, op, _, _, _, _, value in ops:
+            if op == 'append':
+                appends.setdefault(sheet, []).append((op_id, json.loads(value)))
+        for sheet, rows in appends.items():
+            cache.append_rows(sheet, [values for _, values in rows])
+            # Добавленные строки убираем из очереди сразу, чтобы не задублировать их при ошибке
+            with self.lock:
+                self.db.executemany("DELETE FROM outbox WHERE id = ?", [(op_id,) for op_id, _ in rows])
+
+        batches = {}
+        done = []
+        keys_changed = False
+        for op_id, sheet, op, key_column, key, row, col, value in ops:
+            if op != 'update':
+                continue
+            if sheet == 'progress':
+                col = self._progress_column(col)
+            if row is None:
+                row = cache.find_row(sheet, key_column, key)
+                if not row and keys_changed:
+                    # Ключ мог появиться в еще не записанной привязке Telegram ID:
+                    # записываем накопленное, чтобы кэш узнал новые ключи
+                    for batch in batches.values():
+                        batch.flush()
+                    keys_changed = False
+                    row = cache.find_row(sheet, key_column, key)
+            if not row:
+                # Оставляем в очереди: строка может появиться в таблице позже
+                logger.warning(f"Не найдена строка {key_column}={key} на листе {sheet}")
+                continue
+            if sheet not in batches:
+                batches[sheet] = self.gsheets.batch(sheet)
+            batches[sheet].set(row, col, json.loads(value))
+            done.append(op_id)
+            header = cache.table(sheet).header
+            if col <= len(header) and header[col - 1] in INDEX_COLUMNS.get(sheet, ()):
+                keys_changed = True
+        for batch in batches.values():
+            batch.flush()
+
+        with self.lock:
+            self.db.executemany(
+                "DELETE FROM outbox WHERE id = ? AND op = 'update'", [(op_id,) for op_id in done]
+            )
+        return sum(len(rows) for rows in appends.values()) + len(done)
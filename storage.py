@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import threading
+import time
+
+from config import STORAGE_BACKEND, STARTUP_RETRY_MAX
+from leaderboard import Leaderboard
+
+logger = logging.getLogger(__name__)
+
+
+class StorageNotReady(Exception):
+    """Хранилище еще подключается"""
+
+
+class Storage:
+    """Интерфейс хранилища данных календаря"""
+    def __init__(self):
+        self.campaign = None
+        self.leaderboard = None
+        # Версии данных для кэшей ответов: общая эпоха и счетчики по пользователям
+        self.epoch = 0
+        self.versions = {}
+        self.versions_lock = threading.Lock()
+
+    def reload_tasks(self):
+        """Перезагрузить каталог заданий"""
+        raise NotImplementedError
+
+    def register_user(self, user_id, full_name):
+        """Регистрация нового пользователя"""
+        raise NotImplementedError
+
+    def import_participants(self, names=None):
+        """Массовая регистрация участников по списку ФИО"""
+        raise NotImplementedError
+
+    def has_user(self, user_id):
+        """Зарегистрирован ли пользователь с этим Telegram ID"""
+        raise NotImplementedError
+
+    def has_participant(self, full_name):
+        """Есть ли участник с таким ФИО в списке"""
+        raise NotImplementedError
+
+    def progress_matrix(self):
+        """Матрица прогресса всех участников (progress.ProgressMatrix)"""
+        raise NotImplementedError
+
+    def get_user_progress(self, user_id):
+        """Получить прогресс пользователя"""
+        raise NotImplementedError
+
+    def get_user_schedule(self, user_id):
+        """Получить расписание пользователя"""
+        raise NotImplementedError
+
+    def get_all_schedules(self):
+        """Получить расписания всех пользователей по ID_Участника"""
+        raise NotImplementedError
+
+    def get_task_text(self, task_id):
+        """Получить текст задания по ID"""
+        raise NotImplementedError
+
+    def mark_task_done(self, user_id):
+        """Отметить задание как выполненное"""
+        raise NotImplementedError
+
+    def get_next_date(self):
+        """Получить следующую дату для рассылки"""
+        config = self.get_config()
+        if config:
+            return config.get('Следующая_дата')
+        return None
+
+    def update_next_date(self):
+        """Обновить следующую дату"""
+        raise NotImplementedError
+
+    def get_all_active_users(self):
+        """Получить всех активных пользователей"""
+        raise NotImplementedError
+
+    def update_task_status(self, user_id, date_index, status, only_if=None):
+        """Обновить статус задания (если задан only_if - только поверх этого статуса)"""
+        raise NotImplementedError
+
+    def update_task_statuses(self, user_ids, date_index, status, only_if=None):
+        """Обновить статус задания для списка пользователей"""
+        return sum(1 for user_id in user_ids if self.update_task_status(user_id, date_index, status, only_if))
+
+    def get_config(self):
+        """Получить конфигурацию"""
+        raise NotImplementedError
+
+    def mark_overdue(self, date_index, dry_run=False):
+        """Отметить просроченными активные задания дня (dry_run - только посчитать)"""
+        raise NotImplementedError
+
+    def _welcome(self, full_name):
+        """Ответ на успешную регистрацию"""
+        campaign = self.campaign
+        return (
+            f"Регистрация успешна, {full_name}! "
+            f"Первое задание получите {campaign.first_send_date[:5]} в {campaign.send_time}."
+        )
+
+    def data_version(self, user_id):
+        """Версия данных пользователя: меняется при любом изменении его статусов"""
+        return self.epoch, self.versions.get(str(user_id), 0)
+
+    def _touch(self, user_id=None):
+        """Отметить изменение данных пользователя или всех пользователей"""
+        with self.versions_lock:
+            if user_id is None:
+                self.epoch += 1
+            else:
+                user_id = str(user_id)
+                self.versions[user_id] = self.versions.get(user_id, 0) + 1
+
+    def refresh_leaderboard(self):
+        """Перестроить рейтинг по текущему прогрессу"""
+        leaderboard = Leaderboard()
+        leaderboard.load_counts(self.progress_matrix().counts())
+        self.leaderboard = leaderboard
+        return leaderboard
+
+    def _update_leaderboard(self, user_id, name, done):
+        if self.leaderboard is not None:
+            self.leaderboard.set(user_id, name, done)
+
+    def get_leaderboard(self, limit=5):
+        """Топ участников: список пар (ФИО, выполнено)"""
+        leaderboard = self.leaderboard if self.leaderboard is not None else self.refresh_leaderboard()
+        return leaderboard.top(limit)
+
+    def get_user_rank(self, user_id):
+        """Место участника в рейтинге: (место, выполнено) или None"""
+        leaderboard = self.leaderboard if self.leaderboard is not None else self.refresh_leaderboard()
+        return leaderboard.rank(user_id)
+
+    def request_stats(self):
+        """Счетчики запросов к Sheets API"""
+        return {}
+
+    def sheet_cache_stats(self):
+        """Попадания и промахи кэша листов"""
+        return {}
+
+    def sync(self):
+        """Синхронизировать изменения с Google Таблицей (если нужно)"""
+        return 0
+
+    def pending_changes(self):
+        """Сколько изменений еще не отправлено в Google Таблицу"""
+        return 0
+
+
+def create_storage(campaign=None):
+    """Создать хранилище кампании, выбранное в STORAGE_BACKEND"""
+    from gsheets import GoogleSheets
+
+    gsheets = GoogleSheets(campaign)
+    if STORAGE_BACKEND == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(gsheets.campaign.sqlite_path, gsheets)
+    if STORAGE_BACKEND != 'sheets':
+        raise ValueError(f"Неизвестное хранилище: {STORAGE_BACKEND}")
+    return gsheets
+
+
+class LazyStorage:
+    """Хранилище, которое подключается в фоне после запуска бота.
+    
+    До готовности обращения к нему выбрасывают StorageNotReady
+    """
+    def __init__(self, factory=None, retry_max=STARTUP_RETRY_MAX):
+        self.factory = factory
+        self.retry_max = retry_max
+        self.storage = None
+        self.thread = None
+
+    def start_warmup(self):
+        """Начать подключение в фоновом потоке"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._warm_up, name='storage-warmup', daemon=True)
+            self.thread.start()
+
+    def _warm_up(self):
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            try:
+                storage = (self.factory or create_storage)()
+                storage.refresh_leaderboard()
+                self.storage = storage
+                logger.info(f"Хранилище готово за {time.monotonic() - started:.1f} с")
+                return
+            except Exception as e:
+                delay = min(self.retry_max, 2 ** attempt)
+                attempt += 1
+                logger.warning(f"Не удалось подключиться к хранилищу ({e}), повтор через {delay} с")
+                time.sleep(delay)
+
+    def is_ready(self):
+        return self.storage is not None
+
+    def check_ready(self):
+        """Выбросить StorageNotReady, если хранилище еще не подключено"""
+        if self.storage is None:
+            raise StorageNotReady()
+
+    async def wait_ready(self):
+        """Дождаться подключения (для задач планировщика)"""
+        while self.storage is None:
+            await asyncio.sleep(1)
+
+    def __getattr__(self, name):
+        storage = self.__dict__.get('storage')
+        if storage is None:
+            raise StorageNotReady()
+        return getattr(storage, name)
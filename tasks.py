@@ -0,0 +1,33 @@
+import threading
+
+
+class TaskCatalog:
+    """Каталог заданий в памяти, ключ - ID_Задания"""
+    def __init__(self):
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def load(self, records):
+        """Загрузить задания из записей листа"""
+        tasks = {}
+        for task in records:
+            task_id = task.get('ID_Задания')
+            if task_id == '' or task_id is None:
+                continue
+            tasks[task_id] = task.get('Текст_задания', 'Задание не найдено')
+        
+        # Подменяем словарь целиком, чтобы читатели не видели полузагруженный каталог
+        with self.lock:
+            self.tasks = tasks
+        return len(tasks)
+
+    def text(self, task_id):
+        """Текст задания по ID"""
+        return self.tasks.get(task_id, "Задание не найдено")
+
+    def ids(self):
+        """Список ID всех заданий"""
+        return list(self.tasks)
+
+    def __len__(self):
+        return len(self.tasks)
@@ -0,0 +1,57 @@
+"""Матрица прогресса и ее снимок на диске"""
+from progress import ProgressMatrix
+
+HEADER = ['ID_Участника', 'ФИО', 'День', 'Статус_1', 'Статус_2', 'Всего_выполнено', 'Заметки']
+
+
+def make_matrix():
+    return ProgressMatrix.from_values([
+        HEADER,
+        ['1', 'Первый', '0', '✅', '⏳', '1', 'x'],
+        ['', 'Без ID', '0', '➖', '➖', '0', ''],
+        ['3', 'Третий', '0', '✖️', '➖', '0', ''],
+    ])
+
+
+def records(matrix):
+    return [matrix.record(slot) for slot in range(len(matrix))]
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'progress.snapshot')
+    matrix = make_matrix()
+    matrix.save(path, stamp=[7, 3])
+
+    loaded, stamp = ProgressMatrix.load(path)
+    assert stamp == [7, 3]
+    assert loaded.snapshot is not None
+    assert loaded.header == HEADER
+    assert records(loaded) == records(matrix)
+    assert loaded.slot(3) == 2
+    assert loaded.counts() == matrix.counts()
+
+
+def test_first_write_copies_snapshot(tmp_path):
+    path = str(tmp_path / 'progress.snapshot')
+    make_matrix().save(path, stamp=1)
+    loaded, _ = ProgressMatrix.load(path)
+
+    loaded.set_status(loaded.slot(1), 1, '✅')
+    loaded.set_done(loaded.slot(1), 2)
+    assert loaded.snapshot is None
+    assert loaded.status(0, 1) == '✅'
+    assert loaded.record(0)['Всего_выполнено'] == 2
+    # Остальные слоты пережили переход на собственные массивы
+    assert loaded.status(2, 0) == '✖️'
+
+    # Файл снимка не изменился
+    reloaded, _ = ProgressMatrix.load(path)
+    assert reloaded.status(0, 1) == '⏳'
+    assert reloaded.record(0)['Всего_выполнено'] == 1
+
+
+def test_load_rejects_foreign_file(tmp_path):
+    path = tmp_path / 'progress.snapshot'
+    path.write_bytes(b'not a snapshot')
+    assert ProgressMatrix.load(str(path)) is None
+    assert ProgressMatrix.load(str(tmp_path / 'missing')) is None
@@ -0,0 +1,73 @@
+"""Зеркалирование SQLite в таблицу через очередь outbox"""
+import pytest
+
+from bench.fakes import FakeClient, make_spreadsheet
+from campaigns import Campaign
+from config import SHEET_NAMES
+from gsheets import GoogleSheets
+from quota import RequestScheduler
+from sqlite_storage import SQLiteStorage
+
+NAME = 'Новый Участник Тестович'
+
+
+@pytest.fixture
+def sheets():
+    return make_spreadsheet(5)
+
+
+@pytest.fixture
+def storage(sheets, tmp_path, monkeypatch):
+    monkeypatch.setattr(Campaign, 'before_deadline', lambda self, now=None: True)
+    # Квоту Sheets API в тестах не ждем
+    requests = RequestScheduler(per_minute=10 ** 9, burst=10 ** 6)
+    gsheets = GoogleSheets(client=FakeClient(sheets), requests=requests)
+    return SQLiteStorage(str(tmp_path / 'advent.sqlite3'), gsheets)
+
+
+def sheet_rows(sheets, name, user_id):
+    return [row for row in sheets.sheets[SHEET_NAMES[name]].data[1:] if row[0] == str(user_id)]
+
+
+def sync_all(storage):
+    while storage.pending_changes():
+        assert storage.sync()
+
+
+def test_import_bind_broadcast_sync(storage, sheets):
+    assert storage.import_participants([NAME])['progress'] == 1
+    storage.register_user(777, NAME)
+    storage.update_next_date()
+    assert storage.update_task_statuses([777, 100000], 0, '⏳', only_if='➖') == 2
+    sync_all(storage)
+
+    users = sheet_rows(sheets, 'users', 777)
+    assert [row[1:3] for row in users] == [[NAME, 'активен']]
+
+    schedule = storage.get_all_schedules()['777']
+    [schedule_row] = sheet_rows(sheets, 'schedules', 777)
+    header = sheets.sheets[SHEET_NAMES['schedules']].data[0]
+    assert {key: value for key, value in zip(header, schedule_row) if key.startswith('Дата_')} == {
+        key: str(value) for key, value in schedule.items() if key.startswith('Дата_')
+    }
+
+    [progress_row] = sheet_rows(sheets, 'progress', 777)
+    assert progress_row[1:4] == [NAME, '0', '⏳']
+    assert progress_row[4:] == ['➖'] * (storage.campaign.days - 1) + ['0']
+    assert sheet_rows(sheets, 'progress', 100000)[0][3] == '⏳'
+    # Строк с временным ключом до привязки в таблице не остается
+    assert not [row for row in sheets.sheets[SHEET_NAMES['progress']].data if row[1] == NAME and row[0] != '777']
+
+
+def test_done_after_sync_matches_sheet(storage, sheets):
+    storage.update_next_date()
+    storage.update_task_statuses([100001], 0, '⏳')
+    assert storage.mark_task_done(100001).startswith('✅')
+    # Повторная отметка не увеличивает счетчик
+    storage.mark_task_done(100001)
+    sync_all(storage)
+
+    [row] = sheet_rows(sheets, 'progress', 100001)
+    assert row[3] == '✅'
+    assert row[-1] == '1'
+    assert storage.pending_changes() == 0